@@ -0,0 +1,215 @@
+######################################################################
+# Asyncio API of the lexico-syntactic search, for async services
+#  - `filter_async()` : `filter()` (and optionally `resolve()`) of one
+#    sample in a thread, with a timeout, without blocking the event loop
+#  - `filter_stream_async()` : many samples in flight at once (bounded),
+#    so that the conversion and post-processing of some samples overlap
+#    with the Semgrex latency of others
+#
+# Each sample in flight waits on its own Semgrex call : share a
+# `semgrexPool(size=concurrency)` as `backend`, rather than launching a
+# java process per sample. The python engine holds the GIL, and gains
+# nothing from concurrency.
+#
+# A thread cannot be interrupted : a timed out call keeps running, and
+# keeps its thread, until it ends on its own. The timeout only counts
+# from the start of the call, not while it waits for a free thread.
+######################################################################
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from syntacticFilter import *
+
+def _filter_sample(my_sample:sample, resolved:bool, filter_kwargs:dict) -> list[pattern]:
+    raw_patterns = filter(my_sample, **filter_kwargs)
+    if not resolved:
+        return raw_patterns
+    return resolve(raw_patterns, catalog=compiledCatalog.of(filter_kwargs.get("patterns", ALL_PATTERNS)))
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
+
+def _in_thread(loop, started, finished, call):
+    """runs `call()` in a worker thread, telling the event loop when it starts and when it ends"""
+    loop.call_soon_threadsafe(_set_done, started)
+    try:
+        return call()
+    finally:
+        if finished is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(finished)
+
+async def _run_in_thread(call, timeout:float, executor, finished = None):
+    """
+    `call()` run in a thread of `executor`, raising asyncio.TimeoutError if it runs for more than `timeout` seconds
+    (the wait for a free thread is not counted). `finished()` is called on the event loop when the thread is done with it,
+    even after a timeout.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+    future = loop.run_in_executor(executor, partial(_in_thread, loop, started, finished, call))
+    try:
+        await asyncio.wait((started, future), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        # drops the call if it is still queued
+        future.cancel()
+        raise
+    return await asyncio.wait_for(future, timeout)
+
+async def filter_async(
+        my_sample:sample,
+        timeout:float = None,
+        resolved:bool = False,
+        executor = None,
+        **filter_kwargs,
+) -> list[pattern]:
+    """
+    `filter()` of a sample, run in a thread so that the event loop keeps running
+    raises asyncio.TimeoutError once the call has run for `timeout` seconds, the time spent waiting for a free thread excluded
+    (the thread itself cannot be interrupted : it keeps its slot of the executor until the call ends on its own)
+
+    :param timeout: maximum number of seconds (default: None, no timeout)
+    :param resolved: whether to return the patterns kept by `resolve()` instead of the raw patterns (default: False)
+    :param executor: a concurrent.futures executor (default: None, the one of the event loop)
+    :param filter_kwargs: arguments of `filter()` (patterns, backend, prefilter, engine...)
+    """
+    call = partial(_filter_sample, my_sample, resolved, filter_kwargs)
+    return await _run_in_thread(call, timeout, executor)
+
+async def _iterate(samples):
+    """iterates over a sync or async iterable"""
+    if hasattr(samples, "__aiter__"):
+        async for s in samples:
+            yield s
+    else:
+        for s in samples:
+            yield s
+
+async def _next_done(tasks:deque, ordered:bool) -> list:
+    """waits for the first task (ordered) or any task to be done, removes and returns the done ones"""
+    if ordered:
+        return [await tasks.popleft()]
+    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in done:
+        tasks.remove(task)
+    return [task.result() for task in done]
+
+class _threads:
+    def __init__(self, concurrency:int, max_hung:int):
+        """
+        thread pool of a stream : `concurrency` threads for the samples in flight, and `max_hung` spare ones
+        for the timed out calls still running. Once they are all taken, the pool is replaced by a new one
+        (the hung threads end on their own), so that hung calls never hold up the stream.
+        """
+        self.size = concurrency + max_hung
+        self.max_hung = max_hung
+        self.hung = 0
+        self.replaced = 0 # number of pools given up because of hung calls
+        self.executor = self._new()
+
+    def _new(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="filter_async")
+
+    async def run(self, call, timeout:float):
+        """`call()` in a thread of the pool, with a timeout"""
+        executor = self.executor
+        state = {"done": False, "hung": False}
+        def finished():
+            state["done"] = True
+            # a hung call of the current pool gives its thread back
+            if state["hung"] and executor is self.executor:
+                self.hung -= 1
+        try:
+            return await _run_in_thread(call, timeout, executor, finished)
+        except asyncio.TimeoutError:
+            if not state["done"] and executor is self.executor:
+                state["hung"] = True
+                self.hung += 1
+                if self.hung >= self.max_hung:
+                    self.executor.shutdown(wait=False)
+                    self.executor, self.hung = self._new(), 0
+                    self.replaced += 1
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+async def filter_stream_async(
+        samples,
+        concurrency:int = 8,
+        timeout:float = None,
+        ordered:bool = True,
+        resolved:bool = True,
+        return_exceptions:bool = False,
+        executor = None,
+        max_hung:int = None,
+        **filter_kwargs,
+):
+    """
+    filters a stream of samples with at most `concurrency` samples in flight
+    yields (sample, list of pattern instances) for each sample
+
+    Stopping the iteration (break, aclose() or cancellation of the consumer) cancels the samples in flight.
+
+    :param samples: an iterable or async iterable of sample instances
+    :param concurrency: maximum number of samples in flight
+    :param timeout: maximum number of seconds per sample, from the start of its call (default: None, no timeout)
+    :param ordered: whether to yield the samples in input order, or as soon as they are done
+    :param resolved: whether to return the patterns kept by `resolve()` instead of the raw patterns (default: True)
+    :param return_exceptions: whether to yield (sample, exception) for a failing or timed out sample, instead of raising
+    :param executor: a concurrent.futures executor (default: None, a thread pool of this stream, see `max_hung`).
+        Timed out calls keep their threads of a given executor until they end : enough of them stall the stream.
+    :param max_hung: with the default executor, number of timed out calls left running before the pool is replaced by a new one
+        (default: None, `concurrency`)
+    :param filter_kwargs: arguments of `filter()` (patterns, backend, prefilter, engine...)
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be a positive integer")
+    if max_hung is not None and max_hung < 1:
+        raise ValueError("max_hung must be a positive integer")
+    owned = executor is None
+    if owned:
+        threads = _threads(concurrency, max_hung or concurrency)
+
+    async def run(my_sample:sample):
+        call = partial(_filter_sample, my_sample, resolved, filter_kwargs)
+        try:
+            if owned:
+                return my_sample, await threads.run(call, timeout)
+            return my_sample, await _run_in_thread(call, timeout, executor)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return my_sample, e
+
+    tasks = deque()
+    try:
+        async for my_sample in _iterate(samples):
+            # backpressure : no more than `concurrency` samples submitted and not yielded
+            while len(tasks) >= concurrency:
+                for result in await _next_done(tasks, ordered):
+                    yield result
+            tasks.append(asyncio.ensure_future(run(my_sample)))
+
+        while tasks:
+            for result in await _next_done(tasks, ordered):
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if owned:
+            threads.shutdown()
+
+
+if __name__ == "__main__":
+
+    async def main():
+        async for my_sample, found in filter_stream_async(read_samples("examples.conllu"), concurrency=4, engine="python"):
+            print(my_sample.get("id"), [p.get("hash") for p in found])
+
+    asyncio.run(main())
@@ -0,0 +1,6 @@
+######################################################################
+# Benchmarks of the filtering pipeline, run from the repository root :
+#   python -m benchmarks.runBenchmarks --samples 2000
+#  - syntheticCorpus.py : generator of CoNLL-U corpora of any size
+#  - runBenchmarks.py : throughput, latency and memory measures
+######################################################################
@@ -0,0 +1,196 @@
+######################################################################
+# Throughput, latency and memory of the filtering pipeline
+#  - filter : `filter()` sample by sample
+#  - filter_batch : `filter_batch()` over the whole corpus
+#  - resolve : `resolve()` of the raw patterns of each sample
+#  - pipeline : parsing, `filter()` and `resolve()` of each sample
+# Each benchmark runs in a fresh process, for its own peak RSS.
+# Results are saved as JSON, and can be compared with a previous run :
+#   python -m benchmarks.runBenchmarks --samples 2000 --engine python \
+#       --output bench.json --compare previous_bench.json
+######################################################################
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import time
+from datetime import datetime, timezone
+
+BENCHMARKS = ("filter", "filter_batch", "resolve", "pipeline")
+
+def percentile(values:list[float], q:float) -> float:
+    """q-th percentile (0-100) of values, by linear interpolation"""
+    if not values:
+        return 0.
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+def _peak_rss_mb() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+
+def _run_benchmark(name:str, blocks:list[str], options:dict) -> dict:
+    """runs one benchmark (in a worker process), returns its measures"""
+    from syntacticFilter import sample, filter, filter_batch, resolve
+
+    filter_kwargs = {"engine": options["engine"]}
+    if options["persistent"] and options["engine"] == "corenlp":
+        from semgrexBackend import semgrexPool
+        filter_kwargs["backend"] = semgrexPool(size=1)
+
+    samples = [sample(conllu_str=b) for b in blocks] if name != "pipeline" else None
+    # untimed first call : stanza (and torch) are imported on first use, see lazyImports.py
+    start = time.perf_counter()
+    if blocks:
+        resolve(filter(sample(conllu_str=blocks[0]), **filter_kwargs))
+    warmup_seconds = time.perf_counter() - start
+    # memory taken by the imports (stanza...) and the corpus, before the benchmark itself
+    baseline_rss = _peak_rss_mb()
+    latencies = []
+    start = time.perf_counter()
+    if name == "filter":
+        for s in samples:
+            t = time.perf_counter()
+            filter(s, **filter_kwargs)
+            latencies.append(time.perf_counter() - t)
+    elif name == "filter_batch":
+        filter_batch(samples, batch_size=options["batch_size"], **filter_kwargs)
+    elif name == "resolve":
+        raw_patterns = filter_batch(samples, batch_size=options["batch_size"], **filter_kwargs)
+        start = time.perf_counter()
+        for found in raw_patterns:
+            t = time.perf_counter()
+            resolve(found)
+            latencies.append(time.perf_counter() - t)
+    elif name == "pipeline":
+        for b in blocks:
+            t = time.perf_counter()
+            resolve(filter(sample(conllu_str=b), **filter_kwargs))
+            latencies.append(time.perf_counter() - t)
+    else:
+        raise ValueError(f"Unknown benchmark '{name}', expected one of {BENCHMARKS}")
+    seconds = time.perf_counter() - start
+
+    if "backend" in filter_kwargs:
+        filter_kwargs["backend"].close()
+    n_sentences = sum(b.count("\n\n") + 1 for b in blocks)
+    return {
+        "samples": len(blocks),
+        "sentences": n_sentences,
+        "seconds": seconds,
+        "sentences_per_second": n_sentences / seconds if seconds else 0.,
+        # per sample latencies, not measured for the batched benchmark
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "baseline_rss_mb": baseline_rss,
+        "warmup_seconds": warmup_seconds,
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(
+        n_samples:int = 1000,
+        seed:int = 0,
+        benchmarks:list[str] = BENCHMARKS,
+        engine:str = "corenlp",
+        batch_size:int = 256,
+        persistent:bool = True,
+        corpus_kwargs:dict = None,
+) -> dict:
+    """
+    runs the benchmarks on a synthetic corpus, each in a new process
+    returns the results, with the run parameters and environment
+
+    :param n_samples: size of the synthetic corpus
+    :param seed: seed of the synthetic corpus
+    :param benchmarks: names of the benchmarks to run, among BENCHMARKS
+    :param engine: "corenlp" or "python", see `filter()`
+    :param batch_size: batch size of `filter_batch()`
+    :param persistent: whether to keep one Semgrex java process for the whole benchmark (corenlp engine)
+    :param corpus_kwargs: other arguments of `generate_blocks()` (weights, bitext_ratio...)
+    """
+    from benchmarks.syntheticCorpus import generate_blocks
+
+    blocks = list(generate_blocks(n_samples, seed=seed, **(corpus_kwargs or {})))
+    options = {"engine": engine, "batch_size": batch_size, "persistent": persistent}
+    results = {}
+    # 'spawn' : a fresh interpreter, so that the peak RSS is the one of the benchmark only
+    context = multiprocessing.get_context("spawn")
+    for name in benchmarks:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_run_benchmark, (name, blocks, options))
+
+    return {
+        "date": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {"n_samples": n_samples, "seed": seed, **options, "corpus": corpus_kwargs or {}},
+        "results": results,
+    }
+
+def compare(current:dict, previous:dict) -> dict:
+    """{benchmark: {measure: current / previous}} for the benchmarks and measures of both runs"""
+    ratios = {}
+    for name, measures in current["results"].items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        ratios[name] = {
+            key: value / before[key]
+            for key, value in measures.items()
+            if key not in ("samples", "sentences") and value is not None and before.get(key)
+        }
+    return ratios
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the filtering pipeline on a synthetic corpus")
+    parser.add_argument("--samples", type=int, default=1000, help="number of synthetic samples")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic corpus")
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument("--engine", default="corenlp", choices=("corenlp", "python"))
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--no-persistent", action="store_true", help="launch a new java process for every Semgrex call")
+    parser.add_argument("--bitext-ratio", type=float, default=0.2, help="part of the samples with several sub-sentences")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file of the results")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    if args.engine == "corenlp":
+        # setting up the CoreNLP resources
+        resources = os.path.expanduser("~/resources/")
+        corenlp_dir = os.path.join(resources, "stanford-corenlp-4.5.8/")
+        os.environ.setdefault("CORENLP_HOME", corenlp_dir)
+
+    report = run_benchmarks(
+        n_samples=args.samples,
+        seed=args.seed,
+        benchmarks=args.benchmarks,
+        engine=args.engine,
+        batch_size=args.batch_size,
+        persistent=not args.no_persistent,
+        corpus_kwargs={"bitext_ratio": args.bitext_ratio},
+    )
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["compared_to"] = {"file": args.compare, "ratios": compare(report, json.load(f))}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    if args.compare:
+        print(json.dumps(report["compared_to"], indent=2))
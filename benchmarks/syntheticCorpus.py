@@ -0,0 +1,148 @@
+######################################################################
+# Synthetic CoNLL-U corpora for the benchmarks
+#  - seeds : the parsed `desc` sentences of the catalog (examples.conllu,
+#    one sample per pattern, its sent_id being the pattern name)
+#  - variants : nouns and simple prepositions are replaced at random,
+#    so that the syntactic shape of the seed (hence its match) is kept
+#  - shapes : BLC, complex prepositions, existentials, and sentences
+#    without spatial term ; samples can hold several sub-sentences (bitexts)
+######################################################################
+
+import copy
+import gzip
+import random
+from typing import Iterator
+
+import conllu
+
+from myCorpusObjects import iter_blocks
+from syntacticFilter import LNs, PREPs
+
+SEEDS_PATH = "examples.conllu"
+
+# (singular, plural)
+NOUNS = [
+    ("house", "houses"), ("tree", "trees"), ("river", "rivers"), ("car", "cars"), ("table", "tables"),
+    ("village", "villages"), ("church", "churches"), ("bridge", "bridges"), ("garden", "gardens"),
+    ("station", "stations"), ("box", "boxes"), ("lamp", "lamps"), ("wall", "walls"), ("field", "fields"),
+    ("school", "schools"), ("shop", "shops"), ("mountain", "mountains"), ("harbour", "harbours"),
+]
+
+# sentences with no spatial term : det noun verb punct
+NOISE_VERBS = [("sleeps", "sleep"), ("waits", "wait"), ("shines", "shine"), ("matters", "matter"), ("changes", "change")]
+
+SHAPES = ("blc", "complex", "existential", "noise")
+DEFAULT_WEIGHTS = {"blc": 0.35, "complex": 0.2, "existential": 0.1, "noise": 0.35}
+
+def seed_shape(name:str) -> str:
+    """shape of a seed, from its pattern name"""
+    if name.startswith("existantial"):
+        return "existential"
+    if "complex" in name:
+        return "complex"
+    return "blc"
+
+def load_seeds(path:str = SEEDS_PATH) -> dict:
+    """{shape: [(pattern name, parsed sub-sentences)]} from the parsed catalog examples"""
+    seeds = {shape: [] for shape in SHAPES if shape != "noise"}
+    for block in iter_blocks(path):
+        sentences = conllu.parse(block)
+        name = sentences[0].metadata["sent_id"]
+        # each sub-sentence is a seed of its own
+        for sentence in sentences:
+            seeds[seed_shape(name)].append((name, sentence))
+    return seeds
+
+def _vary(sentence:conllu.TokenList, rng:random.Random) -> conllu.TokenList:
+    """copy of a sentence with other nouns and simple prepositions"""
+    sentence = copy.deepcopy(sentence)
+    heads = {t["id"]: t for t in sentence if isinstance(t["id"], int)}
+    for token in sentence:
+        xpos, form = token["xpos"], token["form"]
+        if xpos in ("NN", "NNS") and form.lower() not in LNs and token["lemma"] not in LNs:
+            singular, plural = rng.choice(NOUNS)
+            token["form"], token["lemma"] = (plural if xpos == "NNS" else singular), singular
+            if token["id"] == 1:
+                token["form"] = token["form"].capitalize()
+        elif xpos == "IN" and token["deprel"] == "case" and form.lower() in PREPs:
+            # prepositions of complex prepositions (in front of) are kept
+            head = heads.get(token["head"])
+            if head is not None and head["form"].lower() not in LNs and form.lower() != "of":
+                preposition = rng.choice(list(PREPs))
+                token["form"], token["lemma"] = preposition, preposition
+    return sentence
+
+def _noise(rng:random.Random) -> conllu.TokenList:
+    singular, _ = rng.choice(NOUNS)
+    verb, lemma = rng.choice(NOISE_VERBS)
+    rows = [
+        ("The", "the", "DT", 2, "det"),
+        (singular, singular, "NN", 3, "nsubj"),
+        (verb, lemma, "VBZ", 0, "root"),
+        (".", ".", ".", 3, "punct"),
+    ]
+    # no UPOS, as in the seeds
+    return conllu.TokenList([
+        {"id": i, "form": form, "lemma": lemma, "upos": None, "xpos": xpos, "feats": None,
+         "head": head, "deprel": deprel, "deps": None, "misc": None}
+        for i, (form, lemma, xpos, head, deprel) in enumerate(rows, start=1)
+    ])
+
+def _text(sentence:conllu.TokenList) -> str:
+    return " ".join(t["form"] for t in sentence if isinstance(t["id"], int))
+
+def generate_blocks(
+        n_samples:int,
+        seed:int = 0,
+        weights:dict = None,
+        bitext_ratio:float = 0.2,
+        max_sub_sentences:int = 3,
+        seeds_path:str = SEEDS_PATH,
+) -> Iterator[str]:
+    """
+    yields `n_samples` CoNLL-U samples (same format as `iter_blocks()`), deterministic for a given `seed`
+
+    :param weights: probability of each shape of sub-sentence, {"blc", "complex", "existential", "noise"} (default: DEFAULT_WEIGHTS)
+    :param bitext_ratio: part of the samples made of several sub-sentences
+    :param max_sub_sentences: maximum number of sub-sentences of these samples
+    :param seeds_path: parsed examples of the catalog
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    unknown = set(weights) - set(SHAPES)
+    if unknown:
+        raise ValueError(f"Unknown shape(s) {sorted(unknown)}, expected some of {SHAPES}")
+    rng = random.Random(seed)
+    seeds = load_seeds(seeds_path)
+    shapes = [shape for shape in SHAPES if weights[shape] > 0]
+
+    for i in range(n_samples):
+        n_sub = rng.randint(2, max_sub_sentences) if rng.random() < bitext_ratio else 1
+        sentences, names = [], []
+        for shape in rng.choices(shapes, weights=[weights[s] for s in shapes], k=n_sub):
+            if shape == "noise":
+                sentences.append(_noise(rng))
+                names.append("noise")
+            else:
+                name, sentence = rng.choice(seeds[shape])
+                sentences.append(_vary(sentence, rng))
+                names.append(name)
+        sentences[0].metadata = {
+            "sent_id": f"synth-{i}-{'+'.join(names)}",
+            "text": "  ".join(_text(s) for s in sentences),
+        }
+        for sentence in sentences[1:]:
+            sentence.metadata = {}
+        yield "".join(s.serialize() for s in sentences).strip()
+
+def write_corpus(path:str, n_samples:int, **kwargs) -> str:
+    """writes a synthetic corpus (gzip-compressed if `path` ends with .gz), returns its path"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        for block in generate_blocks(n_samples, **kwargs):
+            f.write(block + "\n\n\n")
+    return path
+
+
+if __name__ == "__main__":
+    for block in generate_blocks(3, seed=1, bitext_ratio=0.5):
+        print(block, end="\n\n\n")
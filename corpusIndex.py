@@ -0,0 +1,271 @@
+###################################################################
+# Random access to the samples of a CoNLL-U corpus
+#  - one scan records the byte offset and length of each sample,
+#    keyed by its sent_id, in a SQLite file next to the corpus
+#  - samples are then read from a memory map of the corpus,
+#    without parsing the rest of the file (e.g. to re-score a match
+#    from its `hash`)
+#  - the same offsets split the corpus into shards of even size
+#
+# Samples are the blocks of `iter_blocks()` (same `group_by`), the
+# corpus must be uncompressed. The index is rebuilt when the size or
+# the mtime of the corpus change.
+###################################################################
+
+import mmap
+import os
+import sqlite3
+from typing import Callable, Iterator
+
+from myCorpusObjects import sample, _EXTENSIONS, _MAGIC_NUMBERS, _metadata_value
+
+def _iter_sentence_spans(f) -> Iterator[tuple[int, int, list[str], int]]:
+    """
+    yields (start, end, metadata lines, number of empty lines following it) for each sentence of a binary stream,
+    start and end being the byte offsets of its first and last characters (line breaks excluded)
+    same sentences as `_iter_sentences()` in myCorpusObjects.py
+    """
+    start = end = None
+    comments, blank_lines, offset, header = [], 0, 0, True
+    for line in f:
+        if not line.strip():
+            if start is not None:
+                blank_lines += 1
+            offset += len(line)
+            continue
+        if blank_lines:
+            yield start, end, comments, blank_lines
+            start, comments, blank_lines = None, [], 0
+        if start is None:
+            start, header = offset, True
+        if header and line.startswith(b'#'):
+            comments.append(line.decode('utf-8').rstrip('\r\n'))
+        else:
+            header = False
+        offset += len(line)
+        end = offset - (len(line) - len(line.rstrip(b'\r\n')))
+    if start is not None:
+        yield start, end, comments, blank_lines
+
+def iter_block_spans(
+        path:str,
+        group_by:str = None,
+        key_func:Callable[[str], str] = None,
+) -> Iterator[tuple[str, int, int]]:
+    """
+    yields (sent_id, byte offset, byte length) of each sample of a corpus, the samples being those of `iter_blocks()`
+    sent_id is the one of the first sentence of the sample (None if absent)
+    """
+    with open(path, 'rb') as f:
+        block, block_key = [], None
+        for start, end, comments, blank_lines in _iter_sentence_spans(f):
+            if group_by is not None:
+                key = _metadata_value(comments, group_by)
+                if key is not None:
+                    key = key_func(key) if key_func else key
+                    if block and key != block_key:
+                        yield _metadata_value(block[0][2], 'sent_id'), block[0][0], block[-1][1] - block[0][0]
+                        block = []
+                    block_key = key
+            block.append((start, end, comments))
+            if group_by is None and blank_lines >= 2:
+                yield _metadata_value(block[0][2], 'sent_id'), block[0][0], block[-1][1] - block[0][0]
+                block = []
+        if block:
+            yield _metadata_value(block[0][2], 'sent_id'), block[0][0], block[-1][1] - block[0][0]
+
+def sample_id_of(match) -> str:
+    """id of the sample of a match, from the match itself or from its `hash` ("<id>:subsent-<n>:<pattern>:<nodes>")"""
+    hash_str = match if isinstance(match, str) else match["hash"]
+    return hash_str.rsplit(":subsent-", 1)[0]
+
+
+class corpusIndex:
+    def __init__(
+            self,
+            corpus:str,
+            path:str = None,
+            group_by:str = None,
+            key_func:Callable[[str], str] = None,
+            rebuild:bool = False,
+    ):
+        """
+        Byte offsets of the samples of a CoNLL-U corpus, for random access by sent_id and for sharding.
+        Built by a single scan of the corpus if the index is missing or stale, then opened as is.
+
+        :param corpus: path of the (uncompressed) CoNLL-U corpus
+        :param path: SQLite file of the index (default: corpus + ".index.sqlite")
+        :param group_by: metadata key grouping the sentences into samples, see `iter_blocks()`
+        :param key_func: applied to the `group_by` metadata value, see `iter_blocks()` (not recorded : rebuild if it changes)
+        :param rebuild: whether to scan the corpus again, even if the index is up to date
+        """
+        if os.path.splitext(corpus)[1].lower() in _EXTENSIONS:
+            raise ValueError(f"Byte offsets need an uncompressed corpus, not {corpus}")
+        with open(corpus, 'rb') as f:
+            head = f.read(6)
+        if any(head.startswith(magic) for magic in _MAGIC_NUMBERS):
+            raise ValueError(f"Byte offsets need an uncompressed corpus, {corpus} is compressed")
+
+        self.corpus = corpus
+        self.path = path or corpus + ".index.sqlite"
+        self.group_by = group_by
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            " position INTEGER PRIMARY KEY, sent_id TEXT, offset INTEGER NOT NULL, length INTEGER NOT NULL)"
+        )
+        if rebuild or self._meta() != self._source():
+            self.build(key_func)
+
+        self._file = open(corpus, 'rb')
+        # an empty file cannot be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+    def _source(self) -> dict:
+        stat = os.stat(self.corpus)
+        return {"size": str(stat.st_size), "mtime_ns": str(stat.st_mtime_ns), "group_by": str(self.group_by)}
+
+    def _meta(self) -> dict:
+        return dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+
+    def build(self, key_func:Callable[[str], str] = None):
+        """(re)scans the corpus and records the offsets of its samples"""
+        with self._db:
+            self._db.execute("DROP INDEX IF EXISTS blocks_sent_id")
+            self._db.execute("DROP INDEX IF EXISTS blocks_offset")
+            self._db.execute("DELETE FROM blocks")
+            self._db.execute("DELETE FROM meta")
+            self._db.executemany(
+                "INSERT INTO blocks (sent_id, offset, length) VALUES (?, ?, ?)",
+                iter_block_spans(self.corpus, group_by=self.group_by, key_func=key_func),
+            )
+            # built after the inserts, faster than maintained row by row
+            self._db.execute("CREATE INDEX blocks_sent_id ON blocks (sent_id)")
+            self._db.execute("CREATE INDEX blocks_offset ON blocks (offset)")
+            self._db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", self._source().items())
+
+    #%% random access
+    @property
+    def size(self) -> int:
+        """size of the corpus, in bytes"""
+        return int(self._meta()["size"])
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def __contains__(self, sent_id:str) -> bool:
+        return self.span(sent_id) is not None
+
+    def span(self, sent_id:str) -> tuple[int, int]:
+        """(byte offset, byte length) of the sample, None if absent (the first one if several samples share the sent_id)"""
+        return self._db.execute(
+            "SELECT offset, length FROM blocks WHERE sent_id = ? ORDER BY position LIMIT 1", (sent_id,)
+        ).fetchone()
+
+    def _read(self, offset:int, length:int) -> str:
+        # same string as `iter_blocks()` : stripped lines, sentences separated by one empty line
+        text = self._map[offset:offset + length].decode('utf-8')
+        sentences, sentence = [], []
+        for line in text.split('\n'):
+            line = line.rstrip('\r')
+            if line.strip():
+                sentence.append(line)
+            elif sentence:
+                sentences.append("\n".join(sentence))
+                sentence = []
+        if sentence:
+            sentences.append("\n".join(sentence))
+        return "\n\n".join(sentences)
+
+    def block(self, sent_id:str) -> str:
+        """CoNLL-U string of a sample, as yielded by `iter_blocks()`"""
+        span = self.span(sent_id)
+        if span is None:
+            raise KeyError(sent_id)
+        return self._read(*span)
+
+    def sample(self, sent_id:str) -> sample:
+        """the sample with this sent_id, parsed from its block only"""
+        return sample(conllu_str=self.block(sent_id), id=sent_id)
+
+    def sample_of(self, match) -> sample:
+        """the sample of a match (a pattern, or its hash)"""
+        return self.sample(sample_id_of(match))
+
+    def ids(self) -> Iterator[str]:
+        """sent_id of the samples, in corpus order"""
+        for (sent_id,) in self._db.execute("SELECT sent_id FROM blocks ORDER BY position"):
+            yield sent_id
+
+    def iter_blocks(self, start:int = 0, stop:int = None) -> Iterator[str]:
+        """CoNLL-U strings of the samples at positions [start, stop) of the corpus"""
+        rows = self._db.execute(
+            "SELECT offset, length FROM blocks WHERE position > ? AND position <= ? ORDER BY position",
+            (start, len(self) if stop is None else stop),
+        ).fetchall()
+        for offset, length in rows:
+            yield self._read(offset, length)
+
+    #%% sharding
+    def shards(self, n:int) -> list[tuple[int, int]]:
+        """
+        splits the samples into `n` shards of about the same number of bytes
+        returns the [start, stop) positions of the samples of each shard, in corpus order
+        """
+        if n < 1:
+            raise ValueError("The number of shards must be a positive integer")
+        total = len(self)
+        bounds = [0]
+        for k in range(1, n):
+            # first sample starting after k/n of the corpus
+            row = self._db.execute(
+                "SELECT position FROM blocks WHERE offset >= ? ORDER BY offset LIMIT 1", (self.size * k / n,)
+            ).fetchone()
+            bounds.append(max(bounds[-1], row[0] - 1 if row else total))
+        bounds.append(total)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def iter_shard(self, k:int, n:int) -> Iterator[str]:
+        """CoNLL-U strings of the samples of shard `k` (0-based) out of `n`"""
+        if not 0 <= k < n:
+            raise ValueError(f"Shard {k} out of range for {n} shards")
+        return self.iter_blocks(*self.shards(n)[k])
+
+    def write_shards(self, n:int, prefix:str = None) -> list[str]:
+        """
+        writes each shard as a CoNLL-U file (samples separated by two empty lines, readable by `iter_blocks()`)
+        returns their paths, prefix + ".shard-<k>-of-<n>.conllu"
+
+        :param prefix: path prefix of the shards (default: the corpus path without its extension)
+        """
+        prefix = prefix or os.path.splitext(self.corpus)[0]
+        paths = []
+        for k, (start, stop) in enumerate(self.shards(n)):
+            path = f"{prefix}.shard-{k}-of-{n}.conllu"
+            with open(path, "w", encoding="utf-8") as f:
+                for block in self.iter_blocks(start, stop):
+                    f.write(block + "\n\n\n")
+            paths.append(path)
+        return paths
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    with corpusIndex("examples.conllu") as index:
+        print(len(index), "samples")
+        my_sample = index.sample("blc-en-complex-iln-det")
+        print(my_sample["text"])
+        print(index.sample_of("blc-en-complex-iln-det:subsent-0:blc-en-complex-iln-det:1-5-10")["id"])
+        print(index.shards(3))
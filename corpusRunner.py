@@ -0,0 +1,344 @@
+######################################################################
+# Runs the lexico-syntactic search over a whole corpus
+#  - samples are sent by chunks to a pool of worker processes
+#  - each worker loads once its own Semgrex backend and lexical pre-filter
+#  - the number of chunks in flight is bounded (backpressure),
+#    results are yielded in corpus order or as soon as they are ready
+#  - `run_corpus_resumable()` writes them to a file as they come,
+#    keeps a checkpoint to resume from, and sets failing samples aside
+#  - `shard=(k, n)` restricts a run to the samples of shard k out of n,
+#    chosen by a stable hash of their id (see corpusShards.py)
+######################################################################
+
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+from syntacticFilter import *
+from matchExport import match_record
+from myCorpusObjects import _metadata_value
+
+#%% worker side
+# state of the current worker process, set once by `_init_worker()`
+_WORKER = {}
+
+def _init_worker(config:dict):
+    """loads the Semgrex backend and the pre-filter of a worker process"""
+    _WORKER.clear()
+    _WORKER.update(config)
+    _WORKER["patterns"] = compiledCatalog.of(config["patterns"])
+    _WORKER["backend"] = None
+    if config.get("persistent") and config["engine"] == "corenlp":
+        # the java process exits on its own when this worker exits (end of its stdin)
+        from semgrexBackend import semgrexPool
+        _WORKER["backend"] = semgrexPool(size=1, **config.get("backend_kwargs", {}))
+    _WORKER["prefilter"] = lexicalPrefilter() if config.get("prefilter") else None
+    _WORKER["selector"] = patternSelector() if config.get("selector") else None
+    _WORKER["cache"] = None
+    if config.get("cache"):
+        # one connection per worker process, on the same SQLite file
+        from semgrexCache import semgrexCache
+        _WORKER["cache"] = semgrexCache(config["cache"])
+
+def _close_worker():
+    if _WORKER.get("backend") is not None:
+        _WORKER["backend"].close()
+    if _WORKER.get("cache") is not None:
+        _WORKER["cache"].close()
+
+def _process_chunk(blocks:list[str]) -> list[tuple[str, list[pattern]]]:
+    """filters and resolves a chunk of CoNLL-U samples, returns (sample id, resolved patterns) for each"""
+    samples = [sample(conllu_str=b) for b in blocks]
+    raw_patterns = filter_batch(
+        samples,
+        patterns=_WORKER["patterns"],
+        enhanced=_WORKER["enhanced"],
+        batch_size=len(samples),
+        backend=_WORKER["backend"],
+        prefilter=_WORKER["prefilter"],
+        selector=_WORKER["selector"],
+        cache=_WORKER["cache"],
+        engine=_WORKER["engine"],
+    )
+    return [(s['id'], found) for s, found in zip(samples, resolve_many(raw_patterns, catalog=_WORKER["patterns"]))]
+
+def _block_id(block:str) -> str:
+    """sent_id of a CoNLL-U block, read without parsing it (None if absent), as `sample` does"""
+    return _metadata_value(block.split("\n"), "sent_id")
+
+def _process_chunk_safe(blocks:list[str]) -> list[tuple[str, list[pattern], str]]:
+    """
+    as `_process_chunk()`, but returns (sample id, resolved patterns, error) for each block instead of failing :
+    a failing chunk is retried sample by sample, and the samples still failing get their error message (else None)
+    """
+    try:
+        return [(sample_id, found, None) for sample_id, found in _process_chunk(blocks)]
+    except Exception as e:
+        if len(blocks) == 1:
+            return [(_block_id(blocks[0]), None, f"{type(e).__name__}: {e}")]
+    return [result for block in blocks for result in _process_chunk_safe([block])]
+
+#%% sharding
+def shard_key(block:str) -> str:
+    """key of a sample for sharding : its sent_id, or a digest of its CoNLL-U block if it has none"""
+    sample_id = _block_id(block)
+    return sample_id if sample_id is not None else "sha256:" + hashlib.sha256(block.encode("utf-8")).hexdigest()
+
+def shard_of(key:str, n_shards:int) -> int:
+    """shard (0-based) of a sample key, stable across processes, machines and Python versions (unlike `hash()`)"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % n_shards
+
+def _check_shard(shard:tuple[int, int]):
+    k, n = shard
+    if n < 1 or not 0 <= k < n:
+        raise ValueError(f"Invalid shard {k} of {n}, expected 0 <= shard < n_shards")
+
+def shard_blocks(blocks, shard:int, n_shards:int):
+    """the blocks of shard `shard` out of `n_shards`, see `shard_of()`"""
+    for block in blocks:
+        if shard_of(shard_key(block), n_shards) == shard:
+            yield block
+
+#%% driver side
+def _chunks(iterable, size:int):
+    iterable = iter(iterable)
+    while chunk := list(islice(iterable, size)):
+        yield chunk
+
+def _next_done(pending:deque, ordered:bool) -> list:
+    """pops from `pending` the next chunk(s) to yield : the oldest one if ordered, else the first finished"""
+    if ordered:
+        return [pending.popleft()]
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        pending.remove(future)
+    return list(done)
+
+def _run_chunks(chunks, config:dict, workers:int, ordered:bool, max_pending:int, process=_process_chunk):
+    """yields (chunk, `process(chunk)`) for each chunk, computed in `workers` processes (or in the current one)"""
+    # serial run, in the current process
+    if workers <= 1:
+        _init_worker(config)
+        try:
+            for chunk in chunks:
+                yield chunk, process(chunk)
+        finally:
+            _close_worker()
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as executor:
+        pending = deque()
+        submitted = {}
+        for chunk in chunks:
+            # backpressure : no more than `max_pending` chunks submitted and not yielded
+            while len(pending) >= max_pending:
+                for future in _next_done(pending, ordered):
+                    yield submitted.pop(future), future.result()
+            future = executor.submit(process, chunk)
+            submitted[future] = chunk
+            pending.append(future)
+
+        while pending:
+            for future in _next_done(pending, ordered):
+                yield submitted.pop(future), future.result()
+
+def _config(patterns, enhanced:bool, persistent:bool, prefilter:bool, backend_kwargs:dict, cache:str, selector:bool, engine:str) -> dict:
+    # fails in the driver, rather than in every chunk
+    check_engine(engine, compiledCatalog.of(patterns).strings(enhanced))
+    return {
+        "patterns": patterns,
+        "enhanced": enhanced,
+        "persistent": persistent,
+        "prefilter": prefilter,
+        "backend_kwargs": backend_kwargs or {},
+        "cache": cache,
+        "selector": selector,
+        "engine": engine,
+    }
+
+def run_corpus(
+        path:str,
+        workers:int = None,
+        chunk_size:int = 64,
+        ordered:bool = True,
+        max_pending:int = None,
+        patterns:list[semgrexPattern] | compiledCatalog = ALL_PATTERNS,
+        enhanced:bool = False,
+        persistent:bool = True,
+        prefilter:bool = True,
+        backend_kwargs:dict = None,
+        group_by:str = None,
+        key_func = None,
+        cache:str = None,
+        selector:bool = False,
+        shard:tuple[int, int] = None,
+        engine:str = "corenlp",
+):
+    """
+    runs `filter()` and `resolve()` over a whole corpus with a pool of processes
+    yields (sample id, list of resolved pattern instances) for each sample
+
+    :param path: CoNLL-U corpus file or stream, possibly compressed, streamed with `iter_blocks()`
+    :param workers: number of worker processes (default: number of CPUs). With 0 or 1, runs in the current process.
+    :param chunk_size: number of samples sent at once to a worker (and to Semgrex)
+    :param ordered: whether to yield the samples in corpus order, or as soon as their chunk is done
+    :param max_pending: maximum number of chunks in flight, bounding memory (default: 2 per worker)
+    :param patterns: a list of semgrexPattern instances, or their compiledCatalog (default: ALL_PATTERNS from mySemgrexPatterns.py)
+    :param enhanced: whether to search for enhancedDependencies or not (default: False)
+    :param persistent: whether each worker keeps its own Semgrex java process (see semgrexBackend.py), with the corenlp engine
+    :param prefilter: whether each worker skips sub-sentences with no spatial term (see lexicalPrefilter)
+    :param backend_kwargs: arguments of the workers' semgrexPool (classpath, java_args, command)
+    :param group_by: metadata key grouping the sentences into samples (default: None, two empty lines separate the samples)
+    :param key_func: applied to the `group_by` metadata value, see `iter_blocks()`
+    :param cache: path of a semgrexCache SQLite file shared by the workers (default: None, no cache), see semgrexCache.py
+    :param selector: whether each worker sends to Semgrex only the patterns whose preconditions hold in each sentence (see patternSelector)
+    :param shard: (k, n) to process only the samples of shard k out of n (default: None, the whole corpus), see `shard_of()`
+    :param engine: "corenlp" (Semgrex in java, default) or "python" (pySemgrex.py, no JVM), see `filter_batch()`
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * max(workers, 1)
+
+    config = _config(patterns, enhanced, persistent, prefilter, backend_kwargs, cache, selector, engine)
+    blocks = iter_blocks(path, group_by=group_by, key_func=key_func)
+    if shard is not None:
+        _check_shard(shard)
+        blocks = shard_blocks(blocks, *shard)
+    chunks = _chunks(blocks, chunk_size)
+    for _, results in _run_chunks(chunks, config, workers, ordered, max_pending):
+        yield from results
+
+#%% resumable runs
+def pattern_record(sample_id:str, found:list[pattern]) -> dict:
+    """JSON-serializable record of the resolved patterns of a sample (see `match_record()`, with the text)"""
+    return {"id": sample_id, "patterns": [match_record(p, include_text=True) for p in found]}
+
+def _load_checkpoint(checkpoint:str, source:str) -> dict:
+    if not os.path.exists(checkpoint):
+        return {"source": source, "blocks": 0, "failed": 0, "output_bytes": 0, "dead_letter_bytes": 0}
+    with open(checkpoint, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state["source"] != source:
+        raise ValueError(f"Checkpoint {checkpoint} was written for {state['source']}, not for {source}")
+    return state
+
+def _save_checkpoint(checkpoint:str, state:dict):
+    # written aside then renamed : a crash never leaves a partial checkpoint
+    tmp = checkpoint + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, checkpoint)
+
+def _open_at(file:str, size:int):
+    """opens a file for appending, after dropping what was written beyond `size` bytes (i.e. after the last checkpoint)"""
+    if size > (os.path.getsize(file) if os.path.exists(file) else 0):
+        raise ValueError(f"{file} is shorter than at the last checkpoint ({size} bytes): delete the checkpoint to start over")
+    f = open(file, "ab")
+    f.truncate(size)
+    # `tell()` of an append stream stays at the former end of the file, until it is moved
+    f.seek(0, os.SEEK_END)
+    return f
+
+def run_corpus_resumable(
+        path:str,
+        output:str,
+        checkpoint:str = None,
+        dead_letter:str = None,
+        workers:int = None,
+        chunk_size:int = 64,
+        max_pending:int = None,
+        patterns:list[semgrexPattern] | compiledCatalog = ALL_PATTERNS,
+        enhanced:bool = False,
+        persistent:bool = True,
+        prefilter:bool = True,
+        backend_kwargs:dict = None,
+        group_by:str = None,
+        key_func = None,
+        cache:str = None,
+        selector:bool = False,
+        shard:tuple[int, int] = None,
+        engine:str = "corenlp",
+) -> dict:
+    """
+    runs `run_corpus()` writing the results to a JSON Lines file (one `pattern_record()` per sample, in corpus order),
+    which can be stopped at any time and resumed by calling it again with the same arguments.
+
+    After each chunk, the output is flushed and a checkpoint records the number of samples done
+    and the size of the output files. A new call skips these samples and drops the lines written after the checkpoint.
+    Samples which fail (e.g. malformed CoNLL-U, Semgrex error) are written to the dead-letter file,
+    with their CoNLL-U block and the error, instead of stopping the run.
+    Delete the checkpoint to start over.
+
+    Returns {'blocks': samples done, 'failed': samples in the dead-letter file, 'resumed_from': samples done before this call}
+
+    :param path: CoNLL-U corpus file, possibly compressed (a stream cannot be resumed)
+    :param output: JSON Lines file of the results
+    :param checkpoint: checkpoint file (default: output + ".checkpoint")
+    :param dead_letter: JSON Lines file of the failing samples (default: output + ".failed")
+    see `run_corpus()` for the other parameters
+    """
+    checkpoint = checkpoint or output + ".checkpoint"
+    dead_letter = dead_letter or output + ".failed"
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * max(workers, 1)
+
+    source = str(path)
+    blocks = iter_blocks(path, group_by=group_by, key_func=key_func)
+    if shard is not None:
+        _check_shard(shard)
+        source += f" (shard {shard[0]} of {shard[1]})"
+        blocks = shard_blocks(blocks, *shard)
+
+    state = _load_checkpoint(checkpoint, source)
+    resumed_from = state["blocks"]
+    config = _config(patterns, enhanced, persistent, prefilter, backend_kwargs, cache, selector, engine)
+    blocks = islice(blocks, resumed_from, None)
+    chunks = _chunks(blocks, chunk_size)
+
+    with _open_at(output, state["output_bytes"]) as out, _open_at(dead_letter, state["dead_letter_bytes"]) as failed:
+        # chunks are taken in corpus order, so that the checkpoint is a number of samples
+        for chunk, results in _run_chunks(chunks, config, workers, True, max_pending, process=_process_chunk_safe):
+            for block, (sample_id, found, error) in zip(chunk, results):
+                if error is None:
+                    record = pattern_record(sample_id, found)
+                    out.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                else:
+                    record = {"id": sample_id, "error": error, "conllu_str": block}
+                    failed.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                    state["failed"] += 1
+            for f in (out, failed):
+                f.flush()
+                os.fsync(f.fileno())
+            state["blocks"] += len(chunk)
+            state["output_bytes"] = out.tell()
+            state["dead_letter_bytes"] = failed.tell()
+            _save_checkpoint(checkpoint, state)
+
+    return {"blocks": state["blocks"], "failed": state["failed"], "resumed_from": resumed_from}
+
+
+#%% main
+if __name__ == "__main__":
+
+    # setting up the CoreNLP resources
+    resources = os.path.expanduser("~/resources/")
+    corenlp_dir = os.path.join(resources, "stanford-corenlp-4.5.8/")
+    os.environ["CORENLP_HOME"] = corenlp_dir
+
+    for sample_id, potentialBLC in run_corpus("examples.conllu", workers=4, chunk_size=2):
+        print('-'*30)
+        print(sample_id)
+        for p in potentialBLC:
+            print(' ', p.get("hash"))
+
+    # can be interrupted and launched again
+    print(run_corpus_resumable("examples.conllu", "examples.patterns.jsonl", workers=4, chunk_size=2))
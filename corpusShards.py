@@ -0,0 +1,219 @@
+######################################################################
+# Multi-node corpus runs
+#  - each node runs `run_shard(path, output, shard=k, n_shards=N)` on
+#    its own copy of the corpus : the samples of shard k are chosen by
+#    a stable hash of their id (`shard_of()`), so that the N shards are
+#    disjoint and cover the corpus, whatever the machine
+#  - each shard writes its results (as `run_corpus_resumable()`) and a
+#    manifest : shard, corpus fingerprint, number of samples, files
+#  - `merge_shards(manifests, output)` combines the shard outputs,
+#    drops duplicate matches (same `hash`), and checks that every
+#    sample of the corpus was processed exactly once (samples sharing
+#    a sent_id are told apart by their number in the corpus)
+######################################################################
+
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import chain
+
+from corpusRunner import run_corpus_resumable, shard_key, shard_of
+from myCorpusObjects import iter_blocks
+
+def _file_sha256(path:str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+def corpus_fingerprint(path:str, shard:int, n_shards:int, group_by:str = None, key_func = None) -> dict:
+    """
+    one pass over the sample keys of a corpus (no parsing) :
+    number of samples and digest of their keys (the same on every node holding the same corpus),
+    number of samples of the shard, and the keys shared by several samples of the shard, with their number
+    """
+    digest = hashlib.sha256()
+    samples = 0
+    keys = Counter()
+    for block in iter_blocks(path, group_by=group_by, key_func=key_func):
+        key = shard_key(block)
+        digest.update(key.encode("utf-8") + b"\n")
+        samples += 1
+        if shard_of(key, n_shards) == shard:
+            keys[key] += 1
+    return {
+        "corpus_samples": samples,
+        "corpus_digest": digest.hexdigest(),
+        "samples": sum(keys.values()),
+        "repeated": {key: n for key, n in keys.items() if n > 1},
+    }
+
+def run_shard(
+        path:str,
+        output:str,
+        shard:int,
+        n_shards:int,
+        manifest:str = None,
+        **run_kwargs,
+) -> dict:
+    """
+    processes shard `shard` (0-based) out of `n_shards` of a corpus with `run_corpus_resumable()` (hence resumable),
+    then writes its manifest, returned as a dict
+
+    :param path: CoNLL-U corpus file, possibly compressed
+    :param output: JSON Lines file of the results of this shard
+    :param manifest: JSON manifest of the shard (default: output + ".manifest.json")
+    :param run_kwargs: other arguments of `run_corpus_resumable()` (workers, chunk_size, dead_letter, group_by...)
+    """
+    manifest = manifest or output + ".manifest.json"
+    dead_letter = run_kwargs.setdefault("dead_letter", output + ".failed")
+    run = run_corpus_resumable(path, output, shard=(shard, n_shards), **run_kwargs)
+
+    fingerprint = corpus_fingerprint(path, shard, n_shards, run_kwargs.get("group_by"), run_kwargs.get("key_func"))
+    if run["blocks"] != fingerprint["samples"]:
+        raise RuntimeError(f"Shard {shard} of {n_shards} processed {run['blocks']} samples out of {fingerprint['samples']}")
+    # paths relative to the manifest, so that the shard files can be moved together
+    root = os.path.dirname(os.path.abspath(manifest))
+    record = {
+        "source": os.path.basename(str(path)),
+        "shard": shard,
+        "n_shards": n_shards,
+        **fingerprint,
+        "failed": run["failed"],
+        "output": os.path.relpath(os.path.abspath(output), root),
+        "output_sha256": _file_sha256(output),
+        "dead_letter": os.path.relpath(os.path.abspath(dead_letter), root),
+        "created": datetime.now(timezone.utc).isoformat(),
+    }
+    tmp = manifest + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp, manifest)
+    return record
+
+def _read_jsonl(path:str):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def merge_shards(
+        manifests:list[str],
+        output:str,
+        corpus:str = None,
+        strict:bool = True,
+        group_by:str = None,
+        key_func = None,
+) -> dict:
+    """
+    merges the outputs of the shards of a corpus run into one JSON Lines file (and output + ".failed" for the failed samples)
+    Samples are written once, in shard order, their matches deduplicated by `hash`.
+    A sample id is expected as many times as the corpus (or the manifests) count samples with it : only its records beyond are duplicates.
+    returns a report of the coverage ; with `strict`, raises ValueError unless every sample of the corpus was processed exactly once
+
+    :param manifests: manifest files written by `run_shard()`, one per shard
+    :param output: merged JSON Lines file
+    :param corpus: the corpus, to check the coverage sample by sample (default: None, checked against the counts of the manifests)
+    :param group_by: see `iter_blocks()`, to read `corpus`
+    :param key_func: see `iter_blocks()`, to read `corpus`
+    """
+    shards = []
+    for path in manifests:
+        with open(path, "r", encoding="utf-8") as f:
+            shards.append((os.path.dirname(os.path.abspath(path)), json.load(f)))
+    shards.sort(key=lambda s: s[1]["shard"])
+
+    errors = []
+    for key in ("n_shards", "corpus_samples", "corpus_digest"):
+        values = {m[key] for _, m in shards}
+        if len(values) > 1:
+            errors.append(f"Manifests disagree on {key}: {sorted(values, key=str)}")
+    n_shards = shards[0][1]["n_shards"] if shards else 0
+    found = Counter(m["shard"] for _, m in shards)
+    missing_shards = sorted(set(range(n_shards)) - set(found))
+    if missing_shards:
+        errors.append(f"Missing shard(s) {missing_shards} of {n_shards}")
+    if any(n > 1 for n in found.values()):
+        errors.append(f"Shard(s) given twice: {sorted(k for k, n in found.items() if n > 1)}")
+
+    # number of samples of each key : from the corpus, else from the manifests (keys shared by several samples)
+    in_corpus = None
+    per_key = Counter()
+    if corpus is not None:
+        in_corpus = Counter(shard_key(b) for b in iter_blocks(corpus, group_by=group_by, key_func=key_func))
+        per_key = in_corpus
+    else:
+        for _, m in shards:
+            per_key.update(m.get("repeated", {}))
+
+    covered = Counter()
+    misplaced = []
+    report = {"samples": 0, "failed": 0, "matches": 0, "duplicate_samples": 0, "duplicate_matches": 0}
+    with open(output, "w", encoding="utf-8") as out, open(output + ".failed", "w", encoding="utf-8") as failed:
+        for root, m in shards:
+            output_path = os.path.join(root, m["output"])
+            if _file_sha256(output_path) != m["output_sha256"]:
+                errors.append(f"Output of shard {m['shard']} ({output_path}) changed since its manifest was written")
+            records = chain(
+                ((record, out) for record in _read_jsonl(output_path)),
+                ((record, failed) for record in _read_jsonl(os.path.join(root, m["dead_letter"]))),
+            )
+            for record, f in records:
+                key = record["id"] if record.get("id") is not None else shard_key(record["conllu_str"])
+                if shard_of(key, n_shards) != m["shard"]:
+                    misplaced.append(key)
+                covered[key] += 1
+                if covered[key] > max(per_key[key], 1):
+                    # written once, from its first record
+                    report["duplicate_samples"] += 1
+                    report["duplicate_matches"] += len(record.get("patterns") or ())
+                    continue
+                if f is failed:
+                    report["failed"] += 1
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    continue
+                # within the sample : two samples sharing a sent_id share the hashes of their matches
+                patterns = list({p["hash"]: p for p in record["patterns"]}.values())
+                report["duplicate_matches"] += len(record["patterns"]) - len(patterns)
+                report["samples"] += 1
+                report["matches"] += len(patterns)
+                f.write(json.dumps({**record, "patterns": patterns}, ensure_ascii=False) + "\n")
+
+    if misplaced:
+        errors.append(f"{len(misplaced)} sample(s) in the wrong shard, e.g. {misplaced[:3]}")
+    if report["duplicate_samples"]:
+        errors.append(f"{report['duplicate_samples']} sample(s) processed more than once")
+    expected = shards[0][1]["corpus_samples"] if shards else 0
+    if sum(covered.values()) != expected:
+        errors.append(f"{sum(covered.values())} samples processed, the corpus has {expected}")
+    if in_corpus is not None:
+        missing, unexpected = in_corpus - covered, covered - in_corpus
+        report["missing"] = sorted(missing)
+        report["unexpected"] = sorted(unexpected)
+        if missing or unexpected:
+            errors.append(f"{sum(missing.values())} sample(s) of the corpus missing, {sum(unexpected.values())} not in the corpus")
+
+    report["n_shards"] = n_shards
+    report["errors"] = errors
+    if strict and errors:
+        raise ValueError("Shards do not cover the corpus exactly once: " + "; ".join(errors))
+    return report
+
+
+if __name__ == "__main__":
+
+    # setting up the CoreNLP resources
+    resources = os.path.expanduser("~/resources/")
+    corenlp_dir = os.path.join(resources, "stanford-corenlp-4.5.8/")
+    os.environ["CORENLP_HOME"] = corenlp_dir
+
+    # on each node k of 3 : run_shard("examples.conllu", f"examples.shard-{k}.jsonl", shard=k, n_shards=3)
+    for k in range(3):
+        run_shard("examples.conllu", f"examples.shard-{k}.jsonl", shard=k, n_shards=3, workers=1)
+    manifests = [f"examples.shard-{k}.jsonl.manifest.json" for k in range(3)]
+    print(merge_shards(manifests, "examples.merged.jsonl", corpus="examples.conllu"))
@@ -0,0 +1,145 @@
+###################################################################
+# Optional instrumentation of the filtering pipeline
+#  - time spent in each stage (conll2doc, semgrex, to_pattern, ...)
+#  - number of matches of each pattern of the catalog, at each step :
+#    Semgrex candidates, kept by `has_spatial_lexeme()`, kept by `resolve()`
+#  - exported as a summary, or as Prometheus / StatsD counters
+#
+# `filter()`, `filter_batch()`, `resolve()` and `resolve_many()` accept
+# a filterStats as `stats` (default None : no instrumentation at all).
+###################################################################
+
+import socket
+import time
+from collections import Counter, defaultdict
+
+# stages in pipeline order, and steps at which the matches are counted
+STAGES = ("prefilter", "conll2doc", "semgrex", "to_pattern", "has_spatial_lexeme", "resolve")
+STEPS = ("candidates", "lexical", "resolved")
+
+class _stageTimer:
+    __slots__ = ("stats", "stage", "start")
+
+    def __init__(self, stats, stage:str):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, type, value, traceback):
+        self.stats.add_time(self.stage, time.perf_counter() - self.start)
+
+
+class filterStats:
+    def __init__(self):
+        """
+        Timings of the stages of `filter()` / `resolve()`, and match counts per pattern.
+        Stats of several runs (e.g. of worker processes) can be added with `merge()`.
+        """
+        self.seconds = defaultdict(float) # stage -> total time
+        self.calls = Counter() # stage -> number of timed calls
+        self.matches = Counter() # (step, patternName) -> number of matches
+        self._sent = (defaultdict(float), Counter(), Counter()) # totals already sent by `send_statsd()`
+
+    def time(self, stage:str) -> _stageTimer:
+        """context manager adding the time spent in its block to `stage`"""
+        return _stageTimer(self, stage)
+
+    def add_time(self, stage:str, seconds:float):
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+    def count(self, step:str, patterns):
+        """counts the matches of each pattern at a step ("candidates", "lexical" or "resolved")"""
+        self.matches.update((step, p.get("patternName")) for p in patterns)
+
+    def merge(self, other:"filterStats") -> "filterStats":
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] += seconds
+        self.calls.update(other.calls)
+        self.matches.update(other.matches)
+        return self
+
+    #%% exports
+    def report(self) -> dict:
+        """
+        {'stages': {stage: {'seconds', 'calls', 'share'}},
+         'patterns': {patternName: {'candidates', 'lexical', 'resolved', 'survival'}}}
+        where share is the part of the total time, and survival the ratio of resolved to candidates
+        """
+        total = sum(self.seconds.values())
+        stages = {
+            stage: {
+                "seconds": self.seconds[stage],
+                "calls": self.calls[stage],
+                "share": self.seconds[stage] / total if total else 0.,
+            }
+            for stage in sorted(self.seconds, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+        }
+        patterns = {}
+        for name in sorted({name for _, name in self.matches}, key=str):
+            counts = {step: self.matches[(step, name)] for step in STEPS}
+            counts["survival"] = counts["resolved"] / counts["candidates"] if counts["candidates"] else 0.
+            patterns[name] = counts
+        return {"stages": stages, "patterns": patterns}
+
+    def to_prometheus(self, prefix:str = "spatial_filter") -> str:
+        """counters in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Time spent in each stage of the filtering",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}' for stage, seconds in self.seconds.items()]
+        lines += [
+            f"# HELP {prefix}_stage_calls_total Number of timed calls of each stage",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        lines += [f'{prefix}_stage_calls_total{{stage="{stage}"}} {calls}' for stage, calls in self.calls.items()]
+        lines += [
+            f"# HELP {prefix}_matches_total Matches of each pattern, at each step of the filtering",
+            f"# TYPE {prefix}_matches_total counter",
+        ]
+        lines += [
+            f'{prefix}_matches_total{{pattern="{name}",step="{step}"}} {n}'
+            for (step, name), n in sorted(self.matches.items(), key=str)
+        ]
+        return "\n".join(lines) + "\n"
+
+    def to_statsd(self, prefix:str = "spatial_filter") -> list[str]:
+        """
+        counters in the StatsD line format (times in milliseconds)
+        StatsD counters are increments : only what was added since the last `send_statsd()` is given (unchanged counters are left out)
+        """
+        sent_seconds, sent_calls, sent_matches = self._sent
+        lines = [
+            f"{prefix}.stage.{stage}.ms:{(seconds - sent_seconds[stage]) * 1000:.3f}|c"
+            for stage, seconds in self.seconds.items() if seconds != sent_seconds[stage]
+        ]
+        lines += [
+            f"{prefix}.stage.{stage}.calls:{calls - sent_calls[stage]}|c"
+            for stage, calls in self.calls.items() if calls != sent_calls[stage]
+        ]
+        lines += [
+            f"{prefix}.pattern.{name}.{step}:{n - sent_matches[(step, name)]}|c"
+            for (step, name), n in self.matches.items() if n != sent_matches[(step, name)]
+        ]
+        return lines
+
+    def send_statsd(self, host:str = "localhost", port:int = 8125, prefix:str = "spatial_filter"):
+        """sends the counters to a StatsD server (UDP, one datagram per counter), as increments since the last call"""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for line in self.to_statsd(prefix):
+                sock.sendto(line.encode("utf-8"), (host, port))
+        self._sent = (defaultdict(float, self.seconds), Counter(self.calls), Counter(self.matches))
+
+
+if __name__ == "__main__":
+    import json
+    from myCorpusObjects import read_samples
+    from syntacticFilter import filter_batch, resolve_many
+
+    stats = filterStats()
+    resolve_many(filter_batch(read_samples("examples.conllu"), engine="python", stats=stats), stats=stats)
+    print(json.dumps(stats.report(), indent=2))
+    print(stats.to_prometheus())
@@ -0,0 +1,85 @@
+###################################################################
+# Heavy dependencies, imported on first use
+#  - `import stanza` pulls in torch : seconds of start-up,
+#    paid by short jobs even when they never call Semgrex
+#  - a lazyImport stands for a module (or one of its attributes)
+#    and imports it on first attribute access, call or isinstance
+###################################################################
+
+import os
+import sys
+from importlib import import_module
+from importlib.util import find_spec, module_from_spec, spec_from_file_location
+
+def import_standalone(module:str):
+    """
+    imports a module of a package without running the `__init__` of its parents
+    (e.g. "stanza.protobuf.CoreNLP_pb2" needs protobuf only, while `import stanza` pulls in torch)
+    The module is registered under its name : a later import of the package reuses it.
+    """
+    if module in sys.modules:
+        return sys.modules[module]
+    top, *parts = module.split(".")
+    package = find_spec(top) # located, not imported
+    if package is None or not package.submodule_search_locations:
+        raise ImportError(f"No package named '{top}'")
+    path = os.path.join(package.submodule_search_locations[0], *parts) + ".py"
+    spec = spec_from_file_location(module, path)
+    loaded = module_from_spec(spec)
+    sys.modules[module] = loaded
+    try:
+        spec.loader.exec_module(loaded)
+    except BaseException:
+        del sys.modules[module]
+        raise
+    return loaded
+
+class lazyImport:
+    __slots__ = ("_module", "_attribute", "_standalone", "_target")
+
+    def __init__(self, module:str, attribute:str = None, standalone:bool = False):
+        """
+        placeholder of `import module` (or `from module import attribute`), resolved on first use
+
+        :param module: dotted name of the module, e.g. "stanza.server.semgrex"
+        :param attribute: name of the object of the module, e.g. "CoNLL" (default: None, the module itself)
+        :param standalone: whether to import the module without its parent packages, see `import_standalone()`
+        """
+        self._module = module
+        self._attribute = attribute
+        self._standalone = standalone
+        self._target = None
+
+    def load(self):
+        """the imported module or attribute"""
+        if self._target is None:
+            target = import_standalone(self._module) if self._standalone else import_module(self._module)
+            self._target = target if self._attribute is None else getattr(target, self._attribute)
+        return self._target
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def __getattr__(self, name:str):
+        return getattr(self.load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __instancecheck__(self, instance) -> bool:
+        return isinstance(instance, self.load())
+
+    def __repr__(self):
+        name = self._module if self._attribute is None else f"{self._module}.{self._attribute}"
+        return f"lazyImport({name}, {'loaded' if self.loaded else 'not loaded'})"
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    start = time.perf_counter()
+    import syntacticFilter
+    print(f"import syntacticFilter : {(time.perf_counter() - start) * 1000:.1f} ms")
+    print("stanza imported :", "stanza" in sys.modules)
@@ -0,0 +1,198 @@
+###################################################################
+# Streaming export of the found patterns
+#  - one compact record per match (ids, pattern name, footprint,
+#    node roles, figure / st0 / ground, hash), optionally with text
+#  - JSON Lines, written as they come
+#  - Parquet, written by row groups (requires pyarrow)
+###################################################################
+
+import gzip
+import json
+
+from mySemgrexPatterns import ALL_PATTERNS, semgrexPattern, compiledCatalog
+
+RECORD_KEYS = ('id', 'sub_sent_id', 'patternName', 'footprint', 'nodes', 'figure', 'st0', 'ground', 'hash')
+TEXT_KEYS = ('text', 'minimal_span')
+
+def match_record(p, include_text:bool = False) -> dict:
+    """
+    compact record of a `pattern` (or `compactPattern`), without the CoNLL-U string and the tokens of its sample
+
+    :param include_text: whether to add the text of the sample and the minimal span of the match
+    """
+    keys = RECORD_KEYS + TEXT_KEYS if include_text else RECORD_KEYS
+    return {key: p.get(key) for key in keys}
+
+def node_roles(patterns:list[semgrexPattern] | compiledCatalog = ALL_PATTERNS) -> list[str]:
+    """names of the nodes of a pattern catalog (figure, st0, ground...), in order of first appearance"""
+    return list(compiledCatalog.of(patterns).all_roles)
+
+def _sample_matches(results):
+    """patterns from (sample id, patterns) pairs, as yielded by `run_corpus()`"""
+    for _, found in results:
+        yield from found
+
+
+class jsonlWriter:
+    def __init__(
+            self,
+            output,
+            include_text:bool = False,
+    ):
+        """
+        Writes one JSON line per match.
+
+        :param output: file path (gzip-compressed if it ends with .gz) or text stream (left open)
+        :param include_text: whether to add the text of the sample and the minimal span of each match
+        """
+        self.include_text = include_text
+        self._owned = isinstance(output, str)
+        if not self._owned:
+            self.f = output
+        elif output.endswith(".gz"):
+            self.f = gzip.open(output, "wt", encoding="utf-8")
+        else:
+            self.f = open(output, "w", encoding="utf-8")
+        self.count = 0
+
+    def write(self, patterns):
+        for p in patterns:
+            self.f.write(json.dumps(match_record(p, self.include_text), ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def write_results(self, results):
+        """writes the matches of (sample id, patterns) pairs, as yielded by `run_corpus()`"""
+        self.write(_sample_matches(results))
+
+    def close(self):
+        if self._owned:
+            self.f.close()
+        else:
+            self.f.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class parquetWriter:
+    def __init__(
+            self,
+            output:str,
+            include_text:bool = False,
+            row_group_size:int = 100_000,
+            roles:list[str] = None,
+            compression:str = "zstd",
+    ):
+        """
+        Writes the matches to a Parquet file, one row group every `row_group_size` matches.
+        The node roles are stored as a struct column (one integer field per role, null if absent from the pattern).
+
+        :param output: file path
+        :param include_text: whether to add the text of the sample and the minimal span of each match
+        :param row_group_size: number of matches buffered before writing a row group
+        :param roles: names of the nodes (default: all the named nodes of ALL_PATTERNS, see `node_roles()`)
+        :param compression: Parquet compression codec
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow : pip install pyarrow")
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be a positive integer")
+        self._pa = pa
+        self.include_text = include_text
+        self.row_group_size = row_group_size
+        self.roles = list(roles) if roles is not None else node_roles()
+
+        fields = [
+            pa.field('id', pa.string()),
+            pa.field('sub_sent_id', pa.int32()),
+            pa.field('patternName', pa.string()),
+            pa.field('footprint', pa.list_(pa.int32())),
+            pa.field('nodes', pa.struct([pa.field(role, pa.int32()) for role in self.roles])),
+            pa.field('figure', pa.string()),
+            pa.field('st0', pa.string()),
+            pa.field('ground', pa.string()),
+            pa.field('hash', pa.string()),
+        ]
+        if include_text:
+            fields += [pa.field(key, pa.string()) for key in TEXT_KEYS]
+        self.schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(output, self.schema, compression=compression)
+        self._buffer = []
+        self.count = 0
+
+    def write(self, patterns):
+        for p in patterns:
+            record = match_record(p, self.include_text)
+            unknown = set(record['nodes'] or ()) - set(self.roles)
+            if unknown:
+                raise ValueError(f"Node(s) {sorted(unknown)} of pattern {record['patternName']} are not in the roles of the writer")
+            self._buffer.append(record)
+            self.count += 1
+            if len(self._buffer) >= self.row_group_size:
+                self.flush()
+
+    def write_results(self, results):
+        """writes the matches of (sample id, patterns) pairs, as yielded by `run_corpus()`"""
+        self.write(_sample_matches(results))
+
+    def flush(self):
+        """writes the buffered matches as a row group"""
+        if self._buffer:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self.schema)
+            self._writer.write_table(table, row_group_size=len(self._buffer))
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def export_matches(
+        results,
+        output:str,
+        format:str = None,
+        include_text:bool = False,
+        **writer_kwargs,
+) -> int:
+    """
+    writes all the matches of (sample id, patterns) pairs, e.g. from `run_corpus()`, streaming them
+    returns the number of matches written
+
+    :param output: file path
+    :param format: "jsonl" or "parquet" (default: from the extension of `output`)
+    :param include_text: whether to add the text of the sample and the minimal span of each match
+    :param writer_kwargs: other arguments of the writer (e.g. row_group_size)
+    """
+    if format is None:
+        format = "parquet" if output.endswith(".parquet") else "jsonl"
+    writers = {"jsonl": jsonlWriter, "parquet": parquetWriter}
+    if format not in writers:
+        raise ValueError(f"Unknown format '{format}', expected one of {tuple(writers)}")
+    with writers[format](output, include_text=include_text, **writer_kwargs) as writer:
+        writer.write_results(results)
+    return writer.count
+
+
+if __name__ == "__main__":
+
+    # setting up the CoreNLP resources
+    import os
+    resources = os.path.expanduser("~/resources/")
+    corenlp_dir = os.path.join(resources, "stanford-corenlp-4.5.8/")
+    os.environ["CORENLP_HOME"] = corenlp_dir
+
+    from corpusRunner import run_corpus
+
+    print(export_matches(run_corpus("examples.conllu", workers=1), "examples.matches.jsonl"), "matches written")
@@ -0,0 +1,323 @@
+###################################################################
+# Inverted index over the resolved matches of a corpus run
+#  - each match gets an integer id ; the index maps terms to the
+#    sorted ids of their matches (posting lists, uint32 blobs,
+#    one segment per flush, merged by `compact()`) :
+#    st0 / figure / ground forms and lemmas, pattern names,
+#    lexicon category of st0 (LN, PREP) and its entry of spatial_terms.csv
+#  - queries intersect (AND) or merge (OR) the posting lists with NumPy
+#  - matches are returned with a KWIC window, `pattern._get_span()`
+#    of the stored tokens of their sentence
+# Everything is kept in one SQLite file.
+###################################################################
+
+import json
+import sqlite3
+from collections import defaultdict
+
+from myCorpusObjects import pattern
+from lazyImports import lazyImport
+from syntacticFilter import LNs, PREPs
+
+np = lazyImport("numpy")
+
+# fields of the index, and the node of the match they come from
+FIELDS = ("st0", "st0_lemma", "figure", "figure_lemma", "ground", "ground_lemma", "pattern", "category", "marker")
+ROLES = ("st0", "figure", "ground")
+
+_MAX_ID = 2**32 - 1
+
+def intersect(*postings) -> "np.ndarray":
+    """ids in all the posting lists (AND)"""
+    if not postings:
+        return np.empty(0, dtype=np.uint32)
+    # smallest list first, then kept ids looked up in the other lists : no sort of the concatenation as np.intersect1d
+    result, *others = sorted(postings, key=len)
+    for ids in others:
+        if not len(result) or not len(ids):
+            return result[:0]
+        if len(result) * 16 < len(ids):
+            # much shorter list : binary search, O(m log n)
+            found = np.searchsorted(ids, result)
+            found[found == len(ids)] = 0
+            result = result[ids[found] == result]
+        else:
+            # lists of similar length : bitmap of the ids, O(m + n)
+            bitmap = np.zeros(int(ids[-1]) + 1, dtype=bool)
+            bitmap[ids] = True
+            result = result[result <= ids[-1]]
+            result = result[bitmap[result]]
+    return result
+
+def union(*postings) -> "np.ndarray":
+    """ids in any of the posting lists (OR)"""
+    postings = [ids for ids in postings if len(ids)]
+    if len(postings) < 2:
+        return postings[0] if postings else np.empty(0, dtype=np.uint32)
+    return np.unique(np.concatenate(postings))
+
+def lexicon_entry(*terms:str, LNs:dict = LNs, PREPs:dict = PREPs) -> tuple[str, str]:
+    """
+    (category, alphabetical marker) in spatial_terms.csv of the first known term (e.g. the form, then the lemma of st0) :
+    ("LN", "front of (in)"), ("PREP", "above")..., (None, None) if none is known
+    """
+    for term in terms:
+        for category, lexicon in (("LN", LNs), ("PREP", PREPs)):
+            for key in (term, term.lower()):
+                if key in lexicon:
+                    return category, lexicon[key]["alphabetical_marker"]
+    return None, None
+
+
+class _storedMatch(dict):
+    """the fields of a stored match read by `pattern._get_span()`"""
+    def __init__(self, footprint:list[int], tokens:list[str], n_tokens:int):
+        super().__init__(footprint=footprint, tokens=range(n_tokens))
+        self._tokens = tokens
+
+    def sentence_tokens(self, sent_id:int) -> list[str]:
+        return self._tokens
+
+    _get_span = pattern._get_span
+
+
+class matchIndex:
+    def __init__(
+            self,
+            path:str = "matches.index.sqlite",
+            flush_every:int = 100_000,
+    ):
+        """
+        Persistent inverted index of resolved matches (pattern or compactPattern instances).
+        Matches are added with `add()` / `add_results()`, deduplicated by `hash`,
+        and their postings written every `flush_every` matches (and on `flush()` / `close()`).
+        Each flush adds a segment to the posting lists of its terms, `compact()` merges them.
+
+        :param path: SQLite file (created if needed)
+        :param flush_every: number of matches buffered in memory before writing their postings
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sentences ("
+            " id INTEGER PRIMARY KEY, sample_id TEXT NOT NULL, sub_sent_id INTEGER NOT NULL,"
+            " tokens TEXT NOT NULL, n_tokens INTEGER NOT NULL, UNIQUE (sample_id, sub_sent_id));"
+            "CREATE TABLE IF NOT EXISTS matches ("
+            " id INTEGER PRIMARY KEY, hash TEXT UNIQUE NOT NULL, sentence INTEGER NOT NULL,"
+            " sample_id TEXT, sub_sent_id INTEGER, patternName TEXT, figure TEXT, st0 TEXT, ground TEXT,"
+            " footprint TEXT, nodes TEXT);"
+            # segment : first id of the segment, the segments of a term are sorted by it
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, segment INTEGER NOT NULL, ids BLOB NOT NULL, PRIMARY KEY (term, segment));"
+        )
+        self._next_id = (self._db.execute("SELECT MAX(id) FROM matches").fetchone()[0] or 0) + 1
+        self._buffer = defaultdict(list) # term -> new ids, not yet in `postings`
+        self._buffered = 0
+
+    #%% building
+    @staticmethod
+    def term(field:str, value:str) -> str:
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field '{field}', expected one of {FIELDS}")
+        if field not in ("pattern", "category", "marker"):
+            value = value.lower()
+        return f"{field}\t{value}"
+
+    def _terms(self, p) -> list[str]:
+        sentence = p.conllu[p["sub_sent_id"]]
+        terms = [self.term("pattern", p["patternName"])]
+        st0 = []
+        for role in ROLES:
+            index = p["nodes"].get(role)
+            if index is None:
+                continue
+            token = sentence[index - 1]
+            terms.append(self.term(role, token["form"]))
+            if token["lemma"]:
+                terms.append(self.term(role + "_lemma", token["lemma"]))
+            if role == "st0":
+                st0 = [t for t in (token["form"], token["lemma"]) if t]
+        category, marker = lexicon_entry(*st0)
+        if category is not None:
+            terms += [self.term("category", category), self.term("marker", marker)]
+        return list(dict.fromkeys(terms))
+
+    def _sentence(self, p) -> int:
+        key = (p["id"], p["sub_sent_id"])
+        row = self._db.execute("SELECT id FROM sentences WHERE sample_id = ? AND sub_sent_id = ?", key).fetchone()
+        if row is not None:
+            return row[0]
+        tokens = p.sentence_tokens(p["sub_sent_id"])
+        return self._db.execute(
+            "INSERT INTO sentences (sample_id, sub_sent_id, tokens, n_tokens) VALUES (?, ?, ?, ?)",
+            (*key, json.dumps(tokens, ensure_ascii=False), len(p["tokens"])),
+        ).lastrowid
+
+    def add(self, patterns) -> int:
+        """indexes resolved matches, returns the number of new ones (a match already indexed, same `hash`, is skipped)"""
+        added = 0
+        for p in patterns:
+            if self._next_id > _MAX_ID:
+                raise ValueError("The index is full (2**32 matches)")
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO matches"
+                " (id, hash, sentence, sample_id, sub_sent_id, patternName, figure, st0, ground, footprint, nodes)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._next_id, p["hash"], self._sentence(p), p["id"], p["sub_sent_id"], p["patternName"],
+                    p["figure"], p["st0"], p["ground"], json.dumps(p["footprint"]), json.dumps(p["nodes"]),
+                ),
+            ).rowcount
+            if not inserted:
+                continue
+            for term in self._terms(p):
+                self._buffer[term].append(self._next_id)
+            self._next_id += 1
+            added += 1
+            self._buffered += 1
+            if self._buffered >= self.flush_every:
+                self.flush()
+        return added
+
+    def add_results(self, results) -> int:
+        """indexes the matches of (sample id, patterns) pairs, as yielded by `run_corpus()`"""
+        return sum(self.add(found) for _, found in results)
+
+    def flush(self):
+        """
+        writes the buffered ids as a new segment of each posting list, without rewriting the former segments
+        (ids only grow : the segments follow each other in id order)
+        """
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO postings (term, segment, ids) VALUES (?, ?, ?)",
+                ((term, ids[0], np.asarray(ids, dtype="<u4").tobytes()) for term, ids in self._buffer.items()),
+            )
+        self._buffer.clear()
+        self._buffered = 0
+
+    def compact(self) -> int:
+        """merges the segments of each posting list into one, returns the number of posting lists merged"""
+        self.flush()
+        merged = 0
+        with self._db:
+            terms = self._db.execute("SELECT term FROM postings GROUP BY term HAVING COUNT(*) > 1").fetchall()
+            for term, in terms:
+                segments = self._db.execute("SELECT segment, ids FROM postings WHERE term = ? ORDER BY segment", (term,)).fetchall()
+                self._db.execute("DELETE FROM postings WHERE term = ?", (term,))
+                # concatenated here : `||` in SQLite turns blobs into TEXT
+                self._db.execute(
+                    "INSERT INTO postings (term, segment, ids) VALUES (?, ?, ?)",
+                    (term, segments[0][0], b"".join(ids for _, ids in segments)),
+                )
+                merged += 1
+        return merged
+
+    #%% queries
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    def postings(self, field:str, value:str) -> "np.ndarray":
+        """sorted ids of the matches with this value of the field"""
+        if self._buffer:
+            self.flush()
+        segments = self._db.execute(
+            "SELECT ids FROM postings WHERE term = ? ORDER BY segment", (self.term(field, value),)
+        ).fetchall()
+        if not segments:
+            return np.empty(0, dtype=np.uint32)
+        if len(segments) == 1:
+            return np.frombuffer(segments[0][0], dtype="<u4")
+        return np.frombuffer(b"".join(ids for ids, in segments), dtype="<u4")
+
+    def values(self, field:str) -> dict:
+        """{value: number of matches} of a field"""
+        if self._buffer:
+            self.flush()
+        prefix = self.term(field, "")
+        rows = self._db.execute(
+            "SELECT term, SUM(length(ids)) / 4 FROM postings WHERE term >= ? AND term < ? GROUP BY term",
+            (prefix, prefix + "\uffff"),
+        )
+        return {term[len(prefix):]: n for term, n in rows}
+
+    def query(self, mode:str = "and", **fields) -> "np.ndarray":
+        """
+        ids of the matches satisfying the fields, e.g. `query(st0="front", figure_lemma=["house", "church"])`
+        A list of values is an OR on the field ; the fields are combined with AND (mode="and") or OR (mode="or").
+        Posting lists can also be combined at will with `postings()`, `intersect()` and `union()`.
+        """
+        if mode not in ("and", "or"):
+            raise ValueError(f"Unknown mode '{mode}', expected 'and' or 'or'")
+        clauses = []
+        for field, values in fields.items():
+            values = [values] if isinstance(values, str) else values
+            clauses.append(union(*(self.postings(field, v) for v in values)))
+        return intersect(*clauses) if mode == "and" else union(*clauses)
+
+    def matches(self, ids, window:int = 5) -> list[dict]:
+        """
+        the stored matches, in id order, with their `kwic` context (`pattern._get_span()` with this window)
+
+        :param ids: match ids, e.g. from `query()`
+        :param window: number of tokens around the footprint
+        """
+        results = []
+        ids = [int(i) for i in ids]
+        # 'IN' lists are limited in size by SQLite
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self._db.execute(
+                "SELECT m.id, m.hash, m.sample_id, m.sub_sent_id, m.patternName, m.figure, m.st0, m.ground,"
+                " m.footprint, m.nodes, s.tokens, s.n_tokens"
+                f" FROM matches m JOIN sentences s ON s.id = m.sentence WHERE m.id IN ({','.join('?' * len(chunk))})"
+                " ORDER BY m.id",
+                chunk,
+            ).fetchall()
+            for match_id, hash_str, sample_id, sub_sent_id, name, figure, st0, ground, footprint, nodes, tokens, n_tokens in rows:
+                footprint = json.loads(footprint)
+                stored = _storedMatch(footprint, json.loads(tokens), n_tokens)
+                results.append({
+                    "match_id": match_id,
+                    "id": sample_id,
+                    "sub_sent_id": sub_sent_id,
+                    "patternName": name,
+                    "figure": figure,
+                    "st0": st0,
+                    "ground": ground,
+                    "hash": hash_str,
+                    "footprint": footprint,
+                    "nodes": json.loads(nodes),
+                    "minimal_span": stored._get_span(sub_sent_id, window=0),
+                    "kwic": stored._get_span(sub_sent_id, window=window),
+                })
+        return results
+
+    def search(self, window:int = 5, limit:int = None, mode:str = "and", **fields) -> list[dict]:
+        """`matches()` of a `query()`, the first `limit` ones"""
+        ids = self.query(mode=mode, **fields)
+        return self.matches(ids[:limit] if limit is not None else ids, window=window)
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    from syntacticFilter import filter_batch, resolve_many
+    from myCorpusObjects import read_samples
+
+    with matchIndex("examples.matches.index.sqlite") as index:
+        for found in resolve_many(filter_batch(read_samples("examples.conllu"), engine="python")):
+            index.add(found)
+        print(len(index), "matches")
+        print(index.values("category"))
+        for match in index.search(category="LN", window=3):
+            print(match["patternName"], "|", match["kwic"])
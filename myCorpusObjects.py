@@ -2,16 +2,29 @@
 # defining basic objects :
 #  - sampled sentences
 #  - found patterns matching any pattern from our catalog 
+#  - compact version of the found patterns, for large corpora
+#  - streaming reader of CoNLL-U corpora, yielding samples
 ###################################################################
 
+import bz2
+import gzip
+import io
 import json
+import lzma
+import os
+import re
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
 import conllu
+from collections.abc import Mapping
 
 class sample(dict):
     def __init__(
             self,
             conllu_str:str,
             id:str = None,
+            parsed:conllu.SentenceList = None,
     ):
         """
         Sentence sampled from a corpus.
@@ -19,10 +32,12 @@ class sample(dict):
 
         :param conllu_str: The CoNLL-U formatted string of the sentence, with eventually metadata 'text' and 'sent_id'
         :param id: Unique identifier for the sentence to use if 'sent_id' metadata is not present in the conllu_str.
+        :param parsed: the already parsed conllu_str (optional, if not provided, conllu_str is parsed)
         """
         
         self['conllu_str'] = conllu_str
-        self.conllu = conllu.parse(conllu_str)
+        self.conllu = parsed if parsed is not None else conllu.parse(conllu_str)
+        self._sent_tokens = {} # forms of each sub-sentence, see `sentence_tokens()`
 
         metadata_id = self.conllu[0].metadata.get('sent_id')
         if metadata_id and not id:
@@ -37,6 +52,11 @@ class sample(dict):
         self['tokens'] = tokens
         self['text'] = self.conllu[0].metadata.get('text', ' '.join(tokens))
         
+    def sentence_tokens(self, sent_id:int) -> list[str]:
+        """forms of the tokens of a sub-sentence (multiword tokens excluded), computed once per sub-sentence"""
+        if sent_id not in self._sent_tokens:
+            self._sent_tokens[sent_id] = [token['form'] for token in self.conllu[sent_id] if isinstance(token["id"], int)]
+        return self._sent_tokens[sent_id]
 
     def __str__(self):
         return json.dumps(self, indent=2, ensure_ascii=False)
@@ -49,14 +69,26 @@ class pattern(sample):
             footprint: list[int],
             id:str = None,
             sub_sent_id: int = 0,
+            parent:sample = None,
     ):
         """
         found pattern in a `sample` instance
 
         :param footprint: list of indexes of the tokens which form the pattern, i.e. positions of the matched nodes
         :param sub_sent_id: the id of the sentence in which the pattern was found (our sample can contain multiple sentences)
+        :param parent: the sample in which the pattern was found (optional).
+            If provided, its parsed CoNLL-U, tokens and text are shared instead of parsing conllu_str again.
         """
-        super().__init__(conllu_str, id, )
+        if parent is not None:
+            # no parsing and no copy : the pattern points to the data of its sample
+            self['conllu_str'] = parent['conllu_str']
+            self['id'] = id if id else parent['id']
+            self['tokens'] = parent['tokens']
+            self['text'] = parent['text']
+            self.conllu = parent.conllu
+            self._sent_tokens = parent._sent_tokens
+        else:
+            super().__init__(conllu_str, id, )
         self['sub_sent_id'] = sub_sent_id
         self['footprint'] = footprint
         
@@ -80,7 +112,7 @@ class pattern(sample):
         end_index = min(len(self['tokens']) - 1, end_index + window)
 
         # Extract the tokens from the conllu data
-        tokens = [token['form'] for token in self.conllu[sent_id] if isinstance(token["id"], int)]
+        tokens = self.sentence_tokens(sent_id)
         
         # Join the tokens to form the minimal span text
         min_span_text = ' '.join(tokens[start_index:end_index + 1])
@@ -91,7 +123,230 @@ class pattern(sample):
     def __str__(self):
         return json.dumps(self, indent=2, ensure_ascii=False)
 
-    
+
+class compactPattern(Mapping):
+    __slots__ = ('sample', 'sub_sent_id', 'nodes_index', 'patternName')
+
+    KEYS = (
+        'conllu_str', 'id', 'tokens', 'text', 'sub_sent_id', 'footprint', 'minimal_span',
+        'nodes', 'patternName', 'figure', 'st0', 'ground', 'hash',
+    )
+
+    def __init__(
+            self,
+            my_sample:sample,
+            nodes_index:tuple[tuple[str, int], ...],
+            sub_sent_id:int = 0,
+            patternName:str = None,
+    ):
+        """
+        found pattern in a `sample` instance, stored compactly :
+        only the sample reference, the sub-sentence id, the named nodes and the pattern name are kept.
+        Every other field (footprint, minimal_span, figure, st0, ground, hash...) is computed on access.
+
+        Reads like the `pattern` dict (`[key]`, `.get()`, `.conllu`) and compares equal to it,
+        `to_dict()` gives back the `pattern` JSON shape.
+
+        :param my_sample: the sample in which the pattern was found
+        :param nodes_index: ((role, index), ...) named nodes, ordered by index (i.e. the footprint)
+        :param sub_sent_id: the id of the sentence in which the pattern was found
+        :param patternName: the name of the matched Semgrex pattern
+        """
+        self.sample = my_sample
+        self.nodes_index = nodes_index
+        self.sub_sent_id = sub_sent_id
+        self.patternName = patternName
+
+    @property
+    def conllu(self) -> conllu.SentenceList:
+        return self.sample.conllu
+
+    def sentence_tokens(self, sent_id:int) -> list[str]:
+        return self.sample.sentence_tokens(sent_id)
+
+    def _form(self, role:str) -> str:
+        index = dict(self.nodes_index).get(role)
+        return self.sample.conllu[self.sub_sent_id][index-1]["form"]
+
+    def _hash(self) -> str:
+        nodes = dict(self.nodes_index)
+        figure_id, st0_id, ground_id = nodes.get("figure"), nodes.get("st0"), nodes.get("ground")
+        return self.sample['id'] + f":subsent-{self.sub_sent_id}" + f":{self.patternName}:{figure_id}-{st0_id}-{ground_id}"
+
+    # same span building as `pattern`
+    _get_span = pattern._get_span
+
+    def __getitem__(self, key:str):
+        if key in ('conllu_str', 'id', 'tokens', 'text'):
+            return self.sample[key]
+        if key == 'sub_sent_id':
+            return self.sub_sent_id
+        if key == 'footprint':
+            return [index for _, index in self.nodes_index]
+        if key == 'minimal_span':
+            return self._get_span(self.sub_sent_id, window=0)
+        if key == 'nodes':
+            return dict(self.nodes_index)
+        if key == 'patternName':
+            return self.patternName
+        if key in ('figure', 'st0', 'ground'):
+            return self._form(key)
+        if key == 'hash':
+            return self._hash()
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def to_dict(self) -> dict:
+        """materializes all the fields, as in a `pattern` (for JSON export)"""
+        return {key: self[key] for key in self.KEYS}
+
+    def to_pattern(self) -> pattern:
+        """full `pattern` instance, sharing the parsed CoNLL-U of the sample"""
+        full = pattern(
+            conllu_str=self.sample['conllu_str'],
+            footprint=self['footprint'],
+            sub_sent_id=self.sub_sent_id,
+            parent=self.sample,
+        )
+        full.update({key: self[key] for key in ('nodes', 'patternName', 'figure', 'st0', 'ground', 'hash')})
+        return full
+
+    def __repr__(self):
+        return f"compactPattern({self._hash()!r})"
+
+    def __str__(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+
+#%% corpus reading
+_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.lzma': 'xz'}
+_MAGIC_NUMBERS = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'xz'}
+
+@contextmanager
+def open_corpus(source, compression:str = 'infer'):
+    """
+    opens a CoNLL-U corpus for reading, as text
+
+    :param source: a file path, or an already opened (text or binary) stream, which is left open
+    :param compression: 'gzip', 'bz2', 'xz', None, or 'infer' (from the file extension, or the first bytes of a binary stream)
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if compression == 'infer':
+            compression = _EXTENSIONS.get(os.path.splitext(source)[1].lower())
+        opener = _OPENERS[compression] if compression else open
+        with opener(source, 'rt', encoding='utf-8') as f:
+            yield f
+        return
+
+    if isinstance(source, io.TextIOBase):
+        yield source
+        return
+
+    if compression == 'infer':
+        head = source.peek(6) if hasattr(source, 'peek') else b''
+        compression = next((c for magic, c in _MAGIC_NUMBERS.items() if head.startswith(magic)), None)
+    if compression:
+        # closing the decompressed stream leaves `source` open
+        with _OPENERS[compression](source, 'rt', encoding='utf-8') as f:
+            yield f
+    else:
+        f = io.TextIOWrapper(source, encoding='utf-8')
+        try:
+            yield f
+        finally:
+            f.detach()
+
+def _iter_sentences(f) -> Iterator[tuple[list[str], int]]:
+    """yields (lines of a sentence, number of empty lines following it)"""
+    sentence, blank_lines = [], 0
+    for line in f:
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            if sentence:
+                blank_lines += 1
+            continue
+        if blank_lines:
+            yield sentence, blank_lines
+            sentence, blank_lines = [], 0
+        sentence.append(line)
+    if sentence:
+        yield sentence, blank_lines
+
+def _metadata_value(sentence:list[str], key:str) -> str:
+    """
+    value of a '# key = value' metadata line of a sentence, None if absent or empty
+    Spaces around '#' and '=' are optional (e.g. '#sent_id=x'), as for `conllu.parse()`.
+    """
+    prefix = re.compile(rf"#\s*{re.escape(key)}\s*=")
+    for line in sentence:
+        line = line.strip()
+        if not line.startswith('#'):
+            break
+        found = prefix.match(line)
+        if found:
+            return line[found.end():].strip() or None
+    return None
+
+def iter_blocks(
+        source,
+        group_by:str = None,
+        key_func:Callable[[str], str] = None,
+        compression:str = 'infer',
+) -> Iterator[str]:
+    """
+    streams the CoNLL-U strings of the samples of a corpus, one sample at a time (bounded memory)
+
+    By default, samples are separated by two empty lines (as in examples.conllu),
+    a single empty line separating the sub-sentences of a sample.
+    With `group_by`, consecutive sentences sharing the same metadata value form a sample
+    (sentences without this metadata stay in the current sample).
+
+    :param source: a file path (possibly compressed) or a stream
+    :param group_by: metadata key grouping the sentences into samples, e.g. 'sent_id' (default: None, empty lines separator)
+    :param key_func: applied to the metadata value before comparison, e.g. `lambda v: v.rsplit('-', 1)[0]` for a shared prefix
+    :param compression: see `open_corpus()`
+    """
+    def join(block):
+        return "\n\n".join("\n".join(sentence) for sentence in block)
+
+    with open_corpus(source, compression=compression) as f:
+        block, block_key = [], None
+        for sentence, blank_lines in _iter_sentences(f):
+            if group_by is not None:
+                key = _metadata_value(sentence, group_by)
+                if key is not None:
+                    key = key_func(key) if key_func else key
+                    if block and key != block_key:
+                        yield join(block)
+                        block = []
+                    block_key = key
+            block.append(sentence)
+            if group_by is None and blank_lines >= 2:
+                yield join(block)
+                block = []
+        if block:
+            yield join(block)
+
+def read_samples(
+        source,
+        group_by:str = None,
+        key_func:Callable[[str], str] = None,
+        compression:str = 'infer',
+) -> Iterator[sample]:
+    """
+    streams the samples of a CoNLL-U corpus, see `iter_blocks()` for the parameters.
+    Each sample must have a 'sent_id' metadata.
+    """
+    for block in iter_blocks(source, group_by=group_by, key_func=key_func, compression=compression):
+        yield sample(conllu_str=block)
+
+
 if __name__ == "__main__":
 
     # Example CoNLL-U (twisted)
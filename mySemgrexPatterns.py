@@ -14,6 +14,10 @@
 # - verb : the copula or the verb governing the BLC
 ######################################################################
 
+import hashlib
+import re
+from functools import lru_cache
+
 BLUE, RED, GREEN, RESET = "\033[94m", "\033[91m", "\033[92m", "\033[0m"
 
 class semgrexPattern:
@@ -259,7 +263,7 @@ MY_PATTERN_11 = semgrexPattern(
     name = 'existantial-en-complex-verb',
     desc = 'There is a prize on top of the wrapper.',
     basic = pattern11,
-    enhanced = pattern11
+    enhanced = pattern11,
 )
 
 
@@ -267,6 +271,107 @@ MY_PATTERN_11 = semgrexPattern(
 ALL_PATTERNS = [v for v in globals().values() if isinstance(v, semgrexPattern)]
 PATTERNS_INDEX = {index: p.name for index,p in enumerate(ALL_PATTERNS)}
 
+#%% compiled catalog
+_NAMED_NODE = re.compile(r"\{([^{}]*)\}=(\w+)")
+
+@lru_cache(maxsize=None)
+def constrain_pattern(pattern_str:str, constraints:tuple[tuple[str, str], ...]) -> str:
+    """
+    adds attributes to the named nodes of a Semgrex pattern, e.g. "{pos:IN}=st0" -> "{pos:IN;word:/^(above|...)$/}=st0"
+    Only the first occurrence of a name (its definition) is constrained, the next ones being back-references.
+    Compiled once per (pattern, constraints).
+
+    :param pattern_str: Semgrex pattern
+    :param constraints: ((node name, attribute), ...), see `lexical_constraints()` in syntacticFilter.py
+    """
+    constraints = dict(constraints)
+    constrained = set()
+
+    def add_attribute(m:re.Match) -> str:
+        attributes, name = m.group(1).strip(), m.group(2)
+        if name not in constraints or name in constrained:
+            return m.group(0)
+        constrained.add(name)
+        attributes = f"{attributes};{constraints[name]}" if attributes else constraints[name]
+        return "{" + attributes + "}=" + name
+
+    return _NAMED_NODE.sub(add_attribute, pattern_str)
+
+class compiledCatalog:
+    def __init__(
+            self,
+            patterns:list[semgrexPattern],
+    ):
+        """
+        A list of patterns, prepared once for all the searches :
+        Semgrex strings (basic, enhanced, possibly constrained), semgrexIndex -> pattern name,
+        named nodes (roles) of each pattern, and a digest of the whole catalog.
+        Semgrex numbers the patterns in the order they are sent, so that a subset of ALL_PATTERNS
+        needs its own index (PATTERNS_INDEX is the one of ALL_PATTERNS).
+
+        :param patterns: semgrexPattern instances, in search order
+        """
+        self.patterns = tuple(patterns)
+        if not self.patterns:
+            raise ValueError("A catalog needs at least one pattern")
+        self.names = tuple(p.name for p in self.patterns)
+        self.index = dict(enumerate(self.names))
+        self.basic = tuple(p.basic for p in self.patterns)
+        self.enhanced = tuple(p.enhanced for p in self.patterns)
+        # named nodes of each pattern, in order of definition
+        self.roles = {
+            p.name: tuple(dict.fromkeys(name for _, name in _NAMED_NODE.findall(p.basic + " " + p.enhanced)))
+            for p in self.patterns
+        }
+        self.all_roles = tuple(dict.fromkeys(role for roles in self.roles.values() for role in roles))
+        self.complex = frozenset(name for name in self.names if "complex" in name)
+
+        digest = hashlib.sha256()
+        for p in self.patterns:
+            digest.update("\0".join((p.name, p.basic, p.enhanced)).encode("utf-8") + b"\1")
+        self.digest = digest.hexdigest()
+        self._strings = {}
+
+    def strings(self, enhanced:bool = False, constraints:tuple = None) -> tuple[str]:
+        """Semgrex strings to send, computed once per (enhanced, constraints)"""
+        key = (enhanced, constraints)
+        if key not in self._strings:
+            strings = self.enhanced if enhanced else self.basic
+            if constraints:
+                strings = tuple(constrain_pattern(p, constraints) for p in strings)
+            self._strings[key] = strings
+        return self._strings[key]
+
+    def name(self, semgrexIndex) -> str:
+        """name of the pattern of a Semgrex match"""
+        return self.index.get(semgrexIndex, "unknown_pattern")
+
+    def is_complex(self, name:str) -> bool:
+        """whether a pattern is a complex preposition one"""
+        return name in self.complex
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __repr__(self):
+        return f"compiledCatalog({len(self)} patterns, {self.digest[:12]})"
+
+    @classmethod
+    def of(cls, patterns) -> "compiledCatalog":
+        """the compiled catalog of a list of patterns (compiled once per list content), or the catalog itself"""
+        if isinstance(patterns, cls):
+            return patterns
+        key = tuple(patterns)
+        if key not in _CATALOGS:
+            _CATALOGS[key] = cls(key)
+        return _CATALOGS[key]
+
+_CATALOGS = {}
+ALL_CATALOG = compiledCatalog.of(ALL_PATTERNS)
+
 if __name__ == "__main__":
     import json
     for p in ALL_PATTERNS:
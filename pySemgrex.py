@@ -0,0 +1,373 @@
+######################################################################
+# Pure-Python engine for the subset of Semgrex used by our catalog
+# (no JVM needed), selected with `filter(..., engine="python")`
+#
+# Supported syntax :
+# - nodes : {} or {attr:value;attr:/regex/} with attr in word, lemma, pos, tag, cpos
+# - named nodes : {...}=name, next occurrences of the name being back-references
+# - relations : >rel, >/regex/, > (any relation)
+# - precedence : A . B (A immediately precedes B), A .. B (A precedes B)
+# - grouping with ( ... ) and conjunction of patterns with :
+# Any other Semgrex syntax raises a ValueError when the pattern is compiled.
+#
+# Matches are returned as a SemgrexResponse, as CoreNLP does,
+# so that `to_pattern()` handles both engines the same way.
+######################################################################
+
+import re
+from functools import lru_cache
+
+import conllu
+from lazyImports import lazyImport
+
+# the protobuf messages of stanza, without stanza itself (which pulls in torch), see lazyImports.py
+SemgrexResponse = lazyImport("stanza.protobuf.CoreNLP_pb2", "SemgrexResponse", standalone=True)
+
+# Semgrex node attributes -> CoNLL-U fields (as sent to CoreNLP by stanza)
+ATTRIBUTES = {
+    'word': 'form',
+    'lemma': 'lemma',
+    'pos': 'xpos',
+    'tag': 'xpos',
+    'cpos': 'upos',
+}
+
+#%% parsing
+class _node:
+    __slots__ = ('attributes', 'name', 'relations')
+
+    def __init__(self, attributes:list, name:str = None):
+        self.attributes = attributes # [(CoNLL-U field, str or compiled regex)]
+        self.name = name
+        self.relations = [] # [(operator, relation name or regex or None, _node)]
+
+
+def _unsupported(pattern_str:str, pos:int, what:str):
+    raise ValueError(f"Unsupported Semgrex syntax ({what}) at position {pos} of pattern: {pattern_str!r}")
+
+def _read_regex(pattern_str:str, pos:int) -> tuple[str, int]:
+    """reads /regex/ starting at `pos` (on the opening slash), returns (regex, position after the closing slash)"""
+    end = pos + 1
+    while end < len(pattern_str):
+        if pattern_str[end] == '\\':
+            end += 2
+            continue
+        if pattern_str[end] == '/':
+            return pattern_str[pos + 1:end], end + 1
+        end += 1
+    _unsupported(pattern_str, pos, "unterminated regex")
+
+def _tokenize(pattern_str:str) -> list[tuple[str, object, int]]:
+    """splits a Semgrex pattern into (kind, value, position) tokens"""
+    tokens = []
+    pos = 0
+    while pos < len(pattern_str):
+        char = pattern_str[pos]
+        if char.isspace():
+            pos += 1
+        elif char == '{':
+            end = pos + 1
+            while end < len(pattern_str) and pattern_str[end] != '}':
+                end = _read_regex(pattern_str, end)[1] if pattern_str[end] == '/' else end + 1
+            if end == len(pattern_str):
+                _unsupported(pattern_str, pos, "unterminated node")
+            tokens.append(('node', pattern_str[pos + 1:end], pos))
+            pos = end + 1
+        elif char == '=':
+            name = re.match(r"=(\w+)", pattern_str[pos:])
+            if not name or not tokens or tokens[-1][0] != 'node':
+                _unsupported(pattern_str, pos, "'=' not naming a node")
+            tokens.append(('name', name.group(1), pos))
+            pos += len(name.group(0))
+        elif char == '>':
+            nxt = pattern_str[pos + 1:pos + 2]
+            if nxt in ('>', '<', '+', '-', '#', '!'):
+                _unsupported(pattern_str, pos, f"relation '>{nxt}'")
+            if nxt == '/':
+                regex, pos = _read_regex(pattern_str, pos + 1)
+                tokens.append(('rel', re.compile(regex), pos))
+            else:
+                name = re.match(r">([\w:]*)", pattern_str[pos:])
+                tokens.append(('rel', name.group(1) or None, pos))
+                pos += len(name.group(0))
+            if pattern_str[pos:pos + 1] == '=':
+                _unsupported(pattern_str, pos, "named relation")
+        elif pattern_str.startswith('..', pos):
+            tokens.append(('prec', '..', pos))
+            pos += 2
+        elif char == '.':
+            tokens.append(('prec', '.', pos))
+            pos += 1
+        elif char in '():':
+            tokens.append((char, char, pos))
+            pos += 1
+        else:
+            _unsupported(pattern_str, pos, f"'{char}'")
+    return tokens
+
+def _parse_attributes(pattern_str:str, body:str, pos:int) -> list:
+    attributes = []
+    body = body.strip()
+    if not body:
+        return attributes
+    parts, start, i = [], 0, 0
+    while i < len(body):
+        if body[i] == '/':
+            i = _read_regex(body, i)[1]
+            continue
+        if body[i] == ';':
+            parts.append(body[start:i])
+            start = i + 1
+        i += 1
+    parts.append(body[start:])
+
+    for part in parts:
+        attr, sep, value = part.strip().partition(':')
+        if not sep or attr not in ATTRIBUTES:
+            _unsupported(pattern_str, pos, f"node attribute '{part.strip()}'")
+        value = value.strip()
+        if value.startswith('/'):
+            regex, end = _read_regex(value, 0)
+            if end != len(value):
+                _unsupported(pattern_str, pos, f"node attribute '{part.strip()}'")
+            value = re.compile(regex)
+        attributes.append((ATTRIBUTES[attr], value))
+    return attributes
+
+class _parser:
+    def __init__(self, pattern_str:str):
+        self.pattern_str = pattern_str
+        self.tokens = _tokenize(pattern_str)
+        self.i = 0
+
+    def peek(self) -> str:
+        return self.tokens[self.i][0] if self.i < len(self.tokens) else None
+
+    def next(self) -> tuple:
+        if self.i == len(self.tokens):
+            _unsupported(self.pattern_str, len(self.pattern_str), "unexpected end")
+        token = self.tokens[self.i]
+        self.i += 1
+        return token
+
+    def expect(self, kind:str) -> tuple:
+        token = self.next()
+        if token[0] != kind:
+            _unsupported(self.pattern_str, token[2], f"expected '{kind}', found '{token[0]}'")
+        return token
+
+    def parse(self) -> list[_node]:
+        """pattern := expr (':' expr)*"""
+        parts = [self.expr()]
+        while self.peek() == ':':
+            self.next()
+            parts.append(self.expr())
+        if self.peek() is not None:
+            _unsupported(self.pattern_str, self.tokens[self.i][2], f"unexpected '{self.peek()}'")
+        return parts
+
+    def expr(self) -> _node:
+        """expr := (node | '(' expr ')') relation*"""
+        if self.peek() == '(':
+            self.next()
+            node = self.expr()
+            self.expect(')')
+        else:
+            node = self.node()
+        while self.peek() in ('rel', 'prec'):
+            kind, value, _ = self.next()
+            operator = '>' if kind == 'rel' else value
+            node.relations.append((operator, value if kind == 'rel' else None, self.child()))
+        return node
+
+    def child(self) -> _node:
+        """child := node | '(' expr ')' ; relations after a bare node belong to its head"""
+        if self.peek() == '(':
+            self.next()
+            node = self.expr()
+            self.expect(')')
+            return node
+        return self.node()
+
+    def node(self) -> _node:
+        _, body, pos = self.expect('node')
+        name = self.next()[1] if self.peek() == 'name' else None
+        return _node(_parse_attributes(self.pattern_str, body, pos), name)
+
+#%% matching
+class dependencyGraph:
+    __slots__ = ('indexes', 'tokens', 'children')
+
+    def __init__(self, sentence:conllu.TokenList, enhanced:bool = False):
+        """
+        indexed view of a parsed CoNLL-U sentence : tokens by index, and children of each node
+
+        :param sentence: a sentence parsed by `conllu`
+        :param enhanced: whether to use the enhanced dependencies (DEPS column) instead of HEAD and DEPREL
+        """
+        self.tokens = {token["id"]: token for token in sentence if isinstance(token["id"], int)}
+        self.indexes = sorted(self.tokens)
+        self.children = {index: [] for index in self.indexes}
+        for index, token in self.tokens.items():
+            if enhanced:
+                arcs = token["deps"] or []
+            else:
+                arcs = [(token["deprel"] or "_", token["head"])]
+            for deprel, head in arcs:
+                if not isinstance(head, int):
+                    raise ValueError(f"Empty nodes are not supported by the python engine (token {index}, head {head})")
+                if head:
+                    self.children[head].append((deprel, index))
+        for edges in self.children.values():
+            edges.sort(key=lambda edge: edge[1])
+
+
+class semgrexMatcher:
+    def __init__(self, pattern_str:str):
+        """
+        compiled Semgrex pattern (supported subset, see module header)
+
+        :param pattern_str: Semgrex pattern
+        """
+        self.pattern_str = pattern_str
+        self.parts = _parser(pattern_str).parse()
+
+    @staticmethod
+    def _check(node:_node, token) -> bool:
+        for field, value in node.attributes:
+            token_value = token[field]
+            if token_value is None:
+                return False
+            if isinstance(value, str):
+                if token_value != value:
+                    return False
+            elif not value.fullmatch(token_value):
+                return False
+        return True
+
+    def _match_node(self, node:_node, index:int, graph:dependencyGraph, bindings:dict):
+        """yields once per way of matching `node` (and its relations) on the graph node `index`"""
+        bound = node.name is not None and node.name in bindings
+        if bound and bindings[node.name] != index:
+            return
+        if not self._check(node, graph.tokens[index]):
+            return
+        if node.name is not None and not bound:
+            bindings[node.name] = index
+            yield from self._match_relations(node.relations, 0, index, graph, bindings)
+            del bindings[node.name]
+        else:
+            yield from self._match_relations(node.relations, 0, index, graph, bindings)
+
+    def _match_relations(self, relations:list, i:int, index:int, graph:dependencyGraph, bindings:dict):
+        if i == len(relations):
+            yield
+            return
+        operator, relation, child = relations[i]
+        for target in self._targets(operator, relation, index, graph):
+            for _ in self._match_node(child, target, graph, bindings):
+                yield from self._match_relations(relations, i + 1, index, graph, bindings)
+
+    @staticmethod
+    def _targets(operator:str, relation, index:int, graph:dependencyGraph):
+        if operator == '>':
+            for deprel, target in graph.children[index]:
+                if relation is None or (deprel == relation if isinstance(relation, str) else relation.fullmatch(deprel)):
+                    yield target
+        elif operator == '.':
+            if index + 1 in graph.tokens:
+                yield index + 1
+        else: # '..'
+            for target in graph.indexes:
+                if target > index:
+                    yield target
+
+    def _match_parts(self, p:int, graph:dependencyGraph, bindings:dict):
+        if p == len(self.parts):
+            yield
+            return
+        part = self.parts[p]
+        candidates = [bindings[part.name]] if part.name in bindings else graph.indexes
+        for index in candidates:
+            if p == 0:
+                bindings['__root__'] = index
+            for _ in self._match_node(part, index, graph, bindings):
+                yield from self._match_parts(p + 1, graph, bindings)
+
+    def matches(self, graph:dependencyGraph):
+        """yields (index of the matched root node, {name: index of the named nodes}) for every match"""
+        bindings = {}
+        for _ in self._match_parts(0, graph, bindings):
+            named = {name: index for name, index in bindings.items() if name != '__root__'}
+            yield bindings['__root__'], named
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern_str:str) -> semgrexMatcher:
+    """compiles a Semgrex pattern once, raises ValueError on unsupported syntax"""
+    return semgrexMatcher(pattern_str)
+
+def preconditions(pattern_str:str) -> tuple[tuple, tuple]:
+    """
+    cheap necessary conditions for a pattern to match a sentence (see `patternSelector` in syntacticFilter.py)
+    returns (relations, nodes) :
+    - relations : the dependency relations the sentence must contain (name, or compiled regex)
+    - nodes : for each node with attributes, ((CoNLL-U field, str or compiled regex), ...) a same token must satisfy
+    raises ValueError on unsupported syntax
+    """
+    relations, nodes = [], []
+
+    def visit(node:_node):
+        if node.attributes:
+            nodes.append(tuple(node.attributes))
+        for operator, relation, child in node.relations:
+            if operator == '>' and relation is not None:
+                relations.append(relation)
+            visit(child)
+
+    for part in compile_pattern(pattern_str).parts:
+        visit(part)
+    return tuple(dict.fromkeys(relations)), tuple(dict.fromkeys(nodes))
+
+def process_sentences(
+        sentences:list[conllu.TokenList],
+        *semgrex_patterns:str,
+        enhanced:bool = False,
+) -> SemgrexResponse:
+    """
+    Returns the result of the semgrex patterns on each of the parsed sentences,
+    as `stanza.server.semgrex.process_doc` does with CoreNLP.
+
+    :param sentences: sentences parsed by `conllu` (e.g. `sample.conllu`)
+    :param semgrex_patterns: Semgrex patterns, in the supported subset
+    :param enhanced: whether to search for enhancedDependencies or not (default: False)
+    """
+    matchers = [compile_pattern(p) for p in semgrex_patterns]
+    response = SemgrexResponse()
+    for sentence in sentences:
+        graph = dependencyGraph(sentence, enhanced=enhanced)
+        graph_result = response.result.add()
+        for semgrex_index, matcher in enumerate(matchers):
+            semgrex_result = graph_result.result.add()
+            for root, named in matcher.matches(graph):
+                match = semgrex_result.match.add()
+                match.matchIndex = root
+                match.semgrexIndex = semgrex_index
+                for name, index in named.items():
+                    node = match.node.add()
+                    node.name = name
+                    node.matchIndex = index
+    return response
+
+
+if __name__ == "__main__":
+    from mySemgrexPatterns import ALL_PATTERNS
+
+    with open("examples.conllu", "r", encoding="utf-8") as f:
+        sentences = conllu.parse(f.read())
+
+    response = process_sentences(sentences, *[p.basic for p in ALL_PATTERNS])
+    for sentence, graph_result in zip(sentences, response.result):
+        print(sentence.metadata.get('text', ''))
+        for p, semgrex_result in zip(ALL_PATTERNS, graph_result.result):
+            for match in semgrex_result.match:
+                print('  ', p.name, {n.name: n.matchIndex for n in match.node})
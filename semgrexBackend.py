@@ -0,0 +1,186 @@
+###################################################################
+# long-lived Semgrex backends
+#  - semgrexWorker : one persistent java process, fed through
+#    stanza's length-prefixed protobuf protocol ('-multiple' mode)
+#  - semgrexPool : several workers, shared by concurrent callers,
+#    with health checks and restart on crash
+#
+# `filter()` and `filter_batch()` accept any of them as `backend`.
+# Without backend, they fall back to `semgrex.process_doc`,
+# which launches a new java process for every call.
+###################################################################
+
+import queue
+import subprocess
+import threading
+
+from stanza.protobuf import SemgrexResponse
+from stanza.server.client import resolve_classpath
+from stanza.server.semgrex import SEMGREX_JAVA, build_request
+
+class semgrexWorker:
+    def __init__(
+            self,
+            classpath:str = None,
+            java_args:list[str] = None,
+            command:list[str] = None,
+    ):
+        """
+        Persistent Semgrex process, speaking the protobuf protocol of `stanza.server.semgrex.Semgrex`.
+        The process is launched lazily, on the first request, and relaunched if it died.
+
+        :param classpath: CoreNLP classpath (default: resolved from $CLASSPATH or $CORENLP_HOME)
+        :param java_args: extra JVM arguments, e.g. ["-Xmx4g"]
+        :param command: full command line of the process, overriding the java one (e.g. a local stand-in server)
+        """
+        if command is None:
+            classpath = resolve_classpath(classpath)
+            if classpath is None:
+                raise ValueError("Classpath is None, Perhaps you need to set the $CLASSPATH or $CORENLP_HOME environment variable to point to a CoreNLP install.")
+            command = ["java"] + (java_args or []) + ["-cp", classpath, SEMGREX_JAVA, "-multiple"]
+        self.command = command
+        self.pipe = None
+        self.restarts = 0
+
+    def start(self):
+        if self.pipe is not None:
+            self.stop()
+        self.pipe = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def stop(self):
+        """asks the process to exit (zero-length request), kills it if it does not"""
+        pipe, self.pipe = self.pipe, None
+        if pipe is None:
+            return
+        try:
+            if pipe.poll() is None:
+                pipe.stdin.write((0).to_bytes(4, 'big'))
+                pipe.stdin.flush()
+                pipe.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pipe.kill()
+            pipe.wait()
+
+    def is_alive(self) -> bool:
+        """health check : the process was launched and has not exited"""
+        return self.pipe is not None and self.pipe.poll() is None
+
+    def process_request(self, request) -> SemgrexResponse:
+        if not self.is_alive():
+            if self.pipe is not None:
+                self.restarts += 1
+            self.start()
+
+        text = request.SerializeToString()
+        self.pipe.stdin.write(len(text).to_bytes(4, 'big'))
+        self.pipe.stdin.write(text)
+        self.pipe.stdin.flush()
+        response_length = self.pipe.stdout.read(4)
+        if len(response_length) < 4:
+            raise BrokenPipeError("Could not communicate with the Semgrex process!")
+        response_length = int.from_bytes(response_length, "big")
+        response_text = self.pipe.stdout.read(response_length)
+        if len(response_text) < response_length:
+            raise BrokenPipeError("Truncated response from the Semgrex process!")
+        response = SemgrexResponse()
+        response.ParseFromString(response_text)
+        return response
+
+    def process_doc(self, doc, *semgrex_patterns, enhanced:bool = False) -> SemgrexResponse:
+        """same signature as `stanza.server.semgrex.process_doc`"""
+        return self.process_request(build_request(doc, semgrex_patterns, enhanced=enhanced))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+
+class semgrexPool:
+    def __init__(
+            self,
+            size:int = 1,
+            max_retries:int = 1,
+            **worker_kwargs,
+    ):
+        """
+        Pool of persistent Semgrex workers, safe to share between threads.
+        Each request checks a worker out, so up to `size` requests run concurrently (one JVM each).
+        A worker whose process crashed is restarted, and the request is retried up to `max_retries` times.
+
+        :param size: number of worker processes
+        :param max_retries: number of retries of a request after a broken pipe
+        :param worker_kwargs: arguments of `semgrexWorker` (classpath, java_args, command)
+        """
+        if size < 1:
+            raise ValueError("size must be a positive integer")
+        self.max_retries = max_retries
+        self.workers = [semgrexWorker(**worker_kwargs) for _ in range(size)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def process_request(self, request) -> SemgrexResponse:
+        if self._closed:
+            raise RuntimeError("The Semgrex pool is closed")
+        worker = self._idle.get()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return worker.process_request(request)
+                except (BrokenPipeError, OSError):
+                    # the process crashed (e.g. JVM OOM) : it is relaunched on next request
+                    worker.stop()
+                    worker.restarts += 1
+                    if attempt == self.max_retries:
+                        raise
+        finally:
+            self._idle.put(worker)
+
+    def process_doc(self, doc, *semgrex_patterns, enhanced:bool = False) -> SemgrexResponse:
+        """same signature as `stanza.server.semgrex.process_doc`"""
+        return self.process_request(build_request(doc, semgrex_patterns, enhanced=enhanced))
+
+    def health(self) -> dict:
+        """state of each worker : {worker index: {'alive': bool, 'restarts': int}}"""
+        return {
+            i: {'alive': w.is_alive(), 'restarts': w.restarts}
+            for i, w in enumerate(self.workers)
+        }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for worker in self.workers:
+                worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+
+    # setting up the CoreNLP resources
+    import os
+    resources = os.path.expanduser("~/resources/")
+    corenlp_dir = os.path.join(resources, "stanford-corenlp-4.5.8/")
+    os.environ["CORENLP_HOME"] = corenlp_dir
+
+    from stanza.utils.conll import CoNLL
+    from mySemgrexPatterns import ALL_PATTERNS
+
+    with open("examples.conllu", "r", encoding="utf-8") as f:
+        doc = CoNLL.conll2doc(input_str=f.read())
+
+    with semgrexPool(size=2) as pool:
+        for _ in range(3):
+            # only the first request pays the JVM launch
+            response = pool.process_doc(doc, *[p.basic for p in ALL_PATTERNS])
+            print(len(response.result), 'sentences processed')
+        print(pool.health())
@@ -0,0 +1,188 @@
+###################################################################
+# on-disk cache of the Semgrex results
+#  - one entry per sentence, keyed by a hash of its CoNLL-U lines,
+#    of the compiled pattern catalog and of the `enhanced` flag
+#  - the raw GraphResult (matches, named nodes) is stored as is,
+#    `to_pattern()` rebuilds the pattern instances from it
+#  - duplicate sentences (e.g. in bitexts) share the same entry
+#  - least recently used entries are evicted beyond max_entries / max_bytes
+#
+# `filter()` and `filter_batch()` accept it as `cache`:
+# only the sentences missing from the cache are sent to Semgrex.
+###################################################################
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+import conllu
+from lazyImports import lazyImport
+
+# the protobuf messages of stanza, without stanza itself (which pulls in torch), see lazyImports.py
+SemgrexResponse = lazyImport("stanza.protobuf.CoreNLP_pb2", "SemgrexResponse", standalone=True)
+
+class semgrexCache:
+    def __init__(
+            self,
+            path:str = "semgrex_cache.sqlite",
+            max_entries:int = None,
+            max_bytes:int = None,
+    ):
+        """
+        Persistent cache of Semgrex results, in a SQLite file which can be shared by several processes.
+
+        :param path: SQLite file (created if needed), or ":memory:"
+        :param max_entries: maximum number of cached sentences (default: None, no limit)
+        :param max_bytes: maximum total size of the cached results (default: None, no limit)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key BLOB PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._db.commit()
+
+    #%% keys
+    @staticmethod
+    def catalog_key(PATTERNS:list[str], enhanced:bool = False, engine:str = "corenlp", selector:bool = False) -> bytes:
+        """
+        digest of the compiled pattern strings (in order, as semgrexIndex refers to it) and of the search options
+
+        :param selector: whether the patterns of each sentence are chosen by a patternSelector (results kept apart from full searches)
+        """
+        h = hashlib.sha256()
+        for p in PATTERNS:
+            h.update(p.encode("utf-8") + b"\0")
+        h.update(f"enhanced={bool(enhanced)};engine={engine}".encode("utf-8"))
+        if selector:
+            # appended only when set : the keys of the searches without selector are unchanged
+            h.update(b";selector=True")
+        return h.digest()
+
+    @staticmethod
+    def sentence_key(catalog:bytes, sentence:conllu.TokenList) -> bytes:
+        """key of a sentence : its token lines (the comments, e.g. sent_id, do not change the matches) and the catalog"""
+        lines = "\n".join(line for line in sentence.serialize().splitlines() if not line.startswith("#"))
+        return hashlib.sha256(catalog + lines.encode("utf-8")).digest()
+
+    #%% storage
+    def get_many(self, keys:list[bytes]) -> dict:
+        """{key: GraphResult} for the keys found in the cache"""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # 'IN' lists are limited in size by SQLite
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, value in rows:
+                    graph_result = SemgrexResponse.GraphResult()
+                    graph_result.ParseFromString(value)
+                    found[key] = graph_result
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                self._db.commit()
+        self.hits += sum(1 for k in keys if k in found)
+        self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items):
+        """stores (key, GraphResult) pairs, then evicts the least recently used entries if needed"""
+        now = time.time()
+        rows = []
+        for key, graph_result in items:
+            value = graph_result.SerializeToString()
+            rows.append((key, value, len(value), now))
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        if self.max_entries is not None:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+        if self.max_bytes is not None:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC, rowid DESC) AS total FROM results)"
+                " WHERE total > ?)", (self.max_bytes,)
+            )
+
+    def search(self, sentences:list[conllu.TokenList], catalog:bytes, search) -> list:
+        """
+        GraphResult of each sentence, from the cache or from `search`
+        Sentences missing from the cache are searched once each, even if repeated.
+
+        :param sentences: parsed sentences
+        :param catalog: `catalog_key()` of the patterns and options
+        :param search: function returning the GraphResult of each of a list of sentences (i.e. calling Semgrex)
+        """
+        keys = [self.sentence_key(catalog, s) for s in sentences]
+        results = self.get_many(keys)
+        missing = {}
+        for key, sentence in zip(keys, sentences):
+            if key not in results:
+                missing.setdefault(key, sentence)
+        if missing:
+            found = list(search(list(missing.values())))
+            if len(found) != len(missing):
+                raise RuntimeError(f"Semgrex returned {len(found)} results for {len(missing)} sentences")
+            self.put_many(zip(missing, found))
+            results.update(zip(missing, found))
+        return [results[k] for k in keys]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def report(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.,
+            "entries": len(self),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    from myCorpusObjects import read_samples
+    from syntacticFilter import filter
+
+    samples = list(read_samples("examples.conllu"))
+    with semgrexCache(":memory:") as cache:
+        for _ in range(2):
+            # the second run does not call Semgrex at all
+            found = [filter(s, engine="python", cache=cache) for s in samples]
+            print(sum(map(len, found)), 'patterns', cache.report())
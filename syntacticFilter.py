@@ -20,10 +20,21 @@
 from myCorpusObjects import * # classes `sample` and `pattern`
 from mySemgrexPatterns import * # importing our semgrex patterns through ALL_PATTERNS catalog
 
-from stanza.server import semgrex
-from stanza.utils.conll import CoNLL
-from google.protobuf.json_format import MessageToDict
-import pandas as pd
+import conllu
+import pySemgrex
+from lazyImports import lazyImport
+import csv
+import json
+import os
+import re
+from itertools import islice
+from collections import Counter
+from contextlib import nullcontext
+
+# heavy dependencies, imported on first use (see lazyImports.py) : stanza pulls in torch
+semgrex = lazyImport("stanza.server.semgrex")
+CoNLL = lazyImport("stanza.utils.conll", "CoNLL")
+SemgrexResponse = lazyImport("stanza.protobuf.CoreNLP_pb2", "SemgrexResponse", standalone=True)
 
 #%% basic "be" english lemmatizer
 # A simple lemmatizer for the verb "be" in English
@@ -39,16 +50,48 @@ simple_lemmatizer_en = {form: 'be' for form in be_forms}
 
 #%% auxiliary functions
 
-def import_spatial_lexeme(file='spatial_terms.csv') -> tuple[dict, dict]:
-    """reads both spatial prepositions and localization nouns"""
-    spatial_terms = pd.read_csv(file).dropna(how='all')
+def read_spatial_terms(file='spatial_terms.csv') -> tuple[dict, dict]:
+    """reads both spatial prepositions and localization nouns from the CSV, {term: row}"""
     LNs = {} # Localization Nouns
     PREPs = {} # Prepositions (simple)
-    for _, row in spatial_terms.iterrows():
-        if pd.notna(row['LN']):
-            LNs[row['LN']] = row
-        else:
-            PREPs[row['alphabetical_marker'].split(' ')[0]] = row
+    with open(file, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {column: value or None for column, value in row.items()}
+            if not any(row.values()):
+                continue
+            if row['LN'] is not None:
+                LNs[row['LN']] = row
+            else:
+                PREPs[row['alphabetical_marker'].split(' ')[0]] = row
+    return LNs, PREPs
+
+def import_spatial_lexeme(file='spatial_terms.csv', artifact:str = None) -> tuple[dict, dict]:
+    """
+    reads both spatial prepositions and localization nouns
+    The lexicon is precompiled into a JSON artifact next to the CSV, reused as long as the CSV keeps its mtime and size.
+
+    :param artifact: path of the precompiled lexicon (default: spatial_terms.lexicon.json for spatial_terms.csv)
+    """
+    if artifact is None:
+        artifact = os.path.splitext(file)[0] + ".lexicon.json"
+    stat = os.stat(file)
+    source = {"file": os.path.basename(file), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    try:
+        with open(artifact, "r", encoding="utf-8") as f:
+            compiled = json.load(f)
+        if compiled.get("source") == source:
+            return compiled["LNs"], compiled["PREPs"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    LNs, PREPs = read_spatial_terms(file)
+    try:
+        tmp = f"{artifact}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"source": source, "LNs": LNs, "PREPs": PREPs}, f, ensure_ascii=False)
+        os.replace(tmp, artifact)
+    except OSError:
+        pass # e.g. read-only directory : the CSV is read again at next import
     return LNs, PREPs
 
 
@@ -63,39 +106,209 @@ def has_spatial_lexeme(pattern:pattern, LNs:dict, PREPs:dict):
     else :
         return False
 
+#%% lexical constraints compiled into the Semgrex patterns
+def lexical_constraints(LNs:dict = LNs, PREPs:dict = PREPs) -> tuple[tuple[str, str], ...]:
+    """
+    Semgrex node constraints equivalent to the Python post-filters :
+    - st0 : a term of the spatial lexicon, as checked by `has_spatial_lexeme()`
+    - verb : a form of "be", as checked by `resolve()` with `simple_lemmatizer_en`
+    Returns ((node name, attribute), ...), usable as a cache key (one per lexicon version).
+    """
+    def word_regex(words) -> str:
+        return "word:/^(" + "|".join(re.escape(w) for w in sorted(words)) + ")$/"
+    return (
+        ("st0", word_regex(set(LNs) | set(PREPs))),
+        ("verb", word_regex(simple_lemmatizer_en)),
+    )
+
+LEXICAL_CONSTRAINTS = lexical_constraints()
+
+class lexicalPrefilter:
+    def __init__(
+            self,
+            LNs:dict = LNs,
+            PREPs:dict = PREPs,
+            use_lemmas:bool = True,
+    ):
+        """
+        Cheap lexical stage run before Semgrex : a sub-sentence which contains no token
+        of the spatial lexicon cannot yield any pattern kept by `has_spatial_lexeme()`,
+        so it is not sent to Semgrex at all.
+        Token forms (as is and lowercased) and, optionally, lemmas are looked up,
+        so that the pre-filter never prunes a sentence `filter()` would have matched.
+
+        The lexicon entries are single words (first word of the prepositions, Localization Nouns),
+        hence a set lookup per token.
+
+        :param LNs: Localization Nouns, as returned by `import_spatial_lexeme()`
+        :param PREPs: simple prepositions, as returned by `import_spatial_lexeme()`
+        :param use_lemmas: whether to also look up the lemmas of the tokens
+        """
+        self.lexicon = frozenset(LNs) | frozenset(PREPs)
+        self.use_lemmas = use_lemmas
+        self.seen = 0 # number of sub-sentences checked
+        self.pruned = 0 # number of sub-sentences not sent to Semgrex
+
+    def has_candidate(self, sentence:conllu.TokenList) -> bool:
+        """whether a parsed sentence contains at least one term of the lexicon"""
+        lexicon = self.lexicon
+        for token in sentence:
+            form = token["form"]
+            if form in lexicon or form.lower() in lexicon:
+                return True
+            if self.use_lemmas and token["lemma"] in lexicon:
+                return True
+        return False
+
+    def candidate_sentences(self, my_sample:sample) -> list[int]:
+        """indexes of the sub-sentences of the sample to be sent to Semgrex"""
+        kept = [i for i, sentence in enumerate(my_sample.conllu) if self.has_candidate(sentence)]
+        self.seen += len(my_sample.conllu)
+        self.pruned += len(my_sample.conllu) - len(kept)
+        return kept
+
+    def report(self) -> dict:
+        return {
+            "seen": self.seen,
+            "pruned": self.pruned,
+            "pruned_ratio": self.pruned / self.seen if self.seen else 0.,
+        }
+
+class patternSelector:
+    def __init__(self):
+        """
+        Picks, for each sentence, the patterns of the catalog whose cheap preconditions hold,
+        so that only these are sent to Semgrex for this sentence :
+        - the dependency relations of the pattern are in the sentence (e.g. expl, cop, /^nmod.*|^obl.*/)
+        - a token has the attributes of each node of the pattern (e.g. {pos:IN}, or the words of a constrained pattern)
+        Relations and attributes are derived from the Semgrex strings sent (see `pySemgrex.preconditions()`);
+        a pattern outside the syntax of pySemgrex.py is always selected.
+        """
+        self._preconditions = {}
+        self.seen = 0 # number of (sentence, pattern) pairs checked
+        self.skipped = 0 # number of (sentence, pattern) pairs not sent to Semgrex
+
+    def preconditions(self, catalog:compiledCatalog, PATTERNS:tuple[str]) -> list[tuple]:
+        """(relations, nodes) of each pattern, computed once per catalog and Semgrex strings"""
+        key = (catalog.digest, tuple(PATTERNS))
+        if key not in self._preconditions:
+            compiled = []
+            for pattern_str in PATTERNS:
+                try:
+                    compiled.append(pySemgrex.preconditions(pattern_str))
+                except ValueError:
+                    compiled.append(((), ()))
+            self._preconditions[key] = compiled
+        return self._preconditions[key]
+
+    @staticmethod
+    def _has_attributes(attributes:tuple, token) -> bool:
+        for field, value in attributes:
+            token_value = token[field]
+            if token_value is None:
+                return False
+            if token_value != value if isinstance(value, str) else not value.fullmatch(token_value):
+                return False
+        return True
+
+    def select(self, sentence:conllu.TokenList, catalog:compiledCatalog, PATTERNS:tuple[str], enhanced:bool = False) -> tuple[int]:
+        """indexes (in the catalog) of the patterns to search in a parsed sentence"""
+        tokens = [token for token in sentence if isinstance(token["id"], int)]
+        if enhanced:
+            deprels = {deprel for token in tokens for deprel, _ in token["deps"] or ()}
+        else:
+            deprels = {token["deprel"] for token in tokens}
+
+        selected = []
+        for i, (relations, nodes) in enumerate(self.preconditions(catalog, PATTERNS)):
+            if (
+                all(r in deprels if isinstance(r, str) else any(r.fullmatch(d) for d in deprels if d) for r in relations)
+                and all(any(self._has_attributes(n, token) for token in tokens) for n in nodes)
+            ):
+                selected.append(i)
+        self.seen += len(PATTERNS)
+        self.skipped += len(PATTERNS) - len(selected)
+        return tuple(selected)
+
+    def report(self) -> dict:
+        return {
+            "seen": self.seen,
+            "skipped": self.skipped,
+            "skipped_ratio": self.skipped / self.seen if self.seen else 0.,
+        }
+
+def _semgrex_input(my_sample:sample, kept:list[int] = None) -> str:
+    """CoNLL-U string to be converted for Semgrex, restricted to the `kept` sub-sentences"""
+    if kept is None or len(kept) == len(my_sample.conllu):
+        return my_sample.get("conllu_str").strip()
+    return "\n".join(my_sample.conllu[i].serialize() for i in kept).strip()
+
+def _expand_results(graph_results:list, kept:list[int], n_sents:int) -> list:
+    """puts the Semgrex results of the `kept` sub-sentences back at their position in the sample (None elsewhere)"""
+    expanded = [None] * n_sents
+    for i, graph_result in zip(kept, graph_results):
+        expanded[i] = graph_result
+    return expanded
+
 def to_pattern(
         my_sample:sample, 
-        semgrexMatches:dict,
+        semgrexMatches:SemgrexResponse,
+        compact:bool = False,
+        catalog:compiledCatalog = None,
 ) -> list[pattern]:
     """
     converts a CoreNLP Semgrex match into a pattern instance.
+    The protobuf response is read as is, without conversion to a dict.
+
+    :param semgrexMatches: the SemgrexResponse of the sample,
+        or the list of its GraphResult (one per sub-sentence, None for a sub-sentence which was not searched)
+    :param compact: whether to build compactPattern instances, with lazily computed fields, instead of pattern instances
+    :param catalog: the compiledCatalog searched, mapping semgrexIndex to pattern names (default: the one of ALL_PATTERNS)
     """
     POTENTIAL_BLC = []
-
-    # peeling the semgrex matches dict
-    for sent_id,sent in enumerate(semgrexMatches.get("result", [])):
-        for mdict in sent.get("result", []) :
-            for match in mdict.get('match', []):
+    if catalog is None:
+        catalog = ALL_CATALOG
+
+    # a SemgrexResponse (of either engine) holds its GraphResults in `result`, a list does not
+    if hasattr(semgrexMatches, "result"):
+        semgrexMatches = semgrexMatches.result
+
+    # peeling the semgrex response
+    for sent_id,sent in enumerate(semgrexMatches):
+        if sent is None:
+            continue
+        for mdict in sent.result:
+            for match in mdict.match:
                 
                 # if nodes were named in the semgrex pattern :
-                if match.get("node") :
-                    unorderedNodes = {n.get("name"): n.get("matchIndex") for n in match.get("node", [])}
+                if match.node :
+                    unorderedNodes = {n.name: n.matchIndex for n in match.node}
                     orderedNodes = sorted(unorderedNodes.items(), key=lambda x: x[1])
                     footprint = [n[1] for n in orderedNodes]
 
+                    if compact:
+                        POTENTIAL_BLC.append(compactPattern(
+                            my_sample,
+                            nodes_index=tuple(orderedNodes),
+                            sub_sent_id=sent_id,
+                            patternName=catalog.name(match.semgrexIndex if match.HasField("semgrexIndex") else "_"),
+                        ))
+                        continue
+
                     # instanciating a pattern object
                     current_pBLC = pattern(
                         id=my_sample.get("id"),
                         conllu_str=my_sample.get("conllu_str"),
                         footprint=footprint,
                         sub_sent_id=sent_id,
+                        parent=my_sample,
                     )
 
                     # adding extra info specific of BLC
                     nodes = dict(orderedNodes)
                     figure_id, st0_id, ground_id = nodes.get("figure"), nodes.get("st0"), nodes.get("ground")
-                    pattern_id = match.get("semgrexIndex", "_")
-                    pattern_name = PATTERNS_INDEX.get(pattern_id, "unknown_pattern")
+                    pattern_id = match.semgrexIndex if match.HasField("semgrexIndex") else "_"
+                    pattern_name = catalog.name(pattern_id)
                     current_pBLC.update(
                         {
                             "nodes": nodes,
@@ -111,51 +324,463 @@ def to_pattern(
 
     return POTENTIAL_BLC
 
+ENGINES = ("corenlp", "python")
+
+def check_engine(engine:str, PATTERNS:list[str]):
+    """fails early on an unknown engine, or on patterns the python engine does not support (see pySemgrex.py)"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    if engine == "python":
+        for p in PATTERNS:
+            pySemgrex.compile_pattern(p)
+
+def run_semgrex(doc, PATTERNS:list[str], enhanced:bool = False, backend = None):
+    """
+    sends a stanza.doc to Semgrex, either through a persistent backend (see semgrexBackend.py)
+    or by launching a new java process (stanza's default)
+    """
+    if backend is None:
+        return semgrex.process_doc(doc, *PATTERNS, enhanced=enhanced)
+    return backend.process_doc(doc, *PATTERNS, enhanced=enhanced)
+
+_NO_TIMER = nullcontext()
+
+def _timer(stats, stage:str):
+    """times a stage if stats (filterStats.py) are collected, else does nothing"""
+    return _NO_TIMER if stats is None else stats.time(stage)
+
+def _scatter_patterns(graph_result, selected:tuple[int], n_patterns:int):
+    """GraphResult of the `selected` patterns, renumbered as in the whole catalog (no match for the other patterns)"""
+    scattered = SemgrexResponse.GraphResult()
+    results = [scattered.result.add() for _ in range(n_patterns)]
+    for semgrex_index, i in enumerate(selected):
+        results[i].CopyFrom(graph_result.result[semgrex_index])
+        for match in results[i].match:
+            match.semgrexIndex = i
+    return scattered
+
+def _sentence_search(
+        PATTERNS:list[str],
+        enhanced:bool = False,
+        backend = None,
+        engine:str = "corenlp",
+        selector:patternSelector = None,
+        catalog:compiledCatalog = None,
+):
+    """
+    function searching the patterns in a list of parsed sentences, returning one GraphResult per sentence (used with a cache)
+    With a selector, the sentences are grouped by their selected patterns, one Semgrex call per group.
+    """
+    def run(sentences:list[conllu.TokenList], patterns:list[str]) -> list:
+        if engine == "python":
+            return pySemgrex.process_sentences(sentences, *patterns, enhanced=enhanced).result
+        doc = CoNLL.conll2doc(input_str="\n".join(s.serialize() for s in sentences).strip())
+        if len(doc.sentences) != len(sentences):
+            raise RuntimeError(f"{len(sentences)} sentences were converted into {len(doc.sentences)} sentences")
+        return run_semgrex(doc, patterns, enhanced, backend).result
+
+    def search(sentences:list[conllu.TokenList]) -> list:
+        if selector is None:
+            return run(sentences, PATTERNS)
+        groups = {}
+        for i, sentence in enumerate(sentences):
+            groups.setdefault(selector.select(sentence, catalog, PATTERNS, enhanced), []).append(i)
+        graph_results = [None] * len(sentences)
+        for selected, indexes in groups.items():
+            if not selected:
+                for i in indexes:
+                    graph_results[i] = _scatter_patterns(None, selected, len(PATTERNS))
+                continue
+            group_results = run([sentences[i] for i in indexes], [PATTERNS[j] for j in selected])
+            for i, graph_result in zip(indexes, group_results):
+                graph_results[i] = _scatter_patterns(graph_result, selected, len(PATTERNS))
+        return graph_results
+    return search
+
 #%% main filtering functions    
 def filter(
     my_sample:sample,
-    patterns:list[semgrexPattern] = ALL_PATTERNS,
+    patterns:list[semgrexPattern] | compiledCatalog = ALL_PATTERNS,
     enhanced:bool = False,   
+    backend = None,
+    prefilter:lexicalPrefilter = None,
+    compact:bool = False,
+    constrained:bool = False,
+    engine:str = "corenlp",
+    cache = None,
+    stats = None,
+    selector:patternSelector = None,
 ) -> list[pattern]:
     """
     performs the lexico-syntactic filtering of the conllu string
     returns a list of pBLC instances
 
     :param my_sample: a sample instance containing the conllu_str to be filtered
-    :param patterns: a list of semgrexPattern instances to be used for filtering (default: ALL_PATTERNS from mySemgrexPatterns.py)
+    :param patterns: a list of semgrexPattern instances to be used for filtering, or their compiledCatalog (default: ALL_PATTERNS from mySemgrexPatterns.py)
     :param enhanced: whether to search for enhancedDependencies or not (default: False)
+    :param backend: a persistent Semgrex backend from semgrexBackend.py (default: None, a java process is launched for this call)
+    :param prefilter: a lexicalPrefilter instance, skipping sub-sentences with no spatial term (default: None, no pre-filtering)
+    :param compact: whether to return compactPattern instances instead of pattern instances (default: False)
+    :param constrained: whether to compile the spatial lexicon (st0) and the "be" forms (verb) into the Semgrex patterns,
+        so that Semgrex discards the candidates removed afterwards by `has_spatial_lexeme()` and `resolve()` (default: False)
+    :param engine: "corenlp" (Semgrex in java, default) or "python" (pySemgrex.py, no JVM, subset of Semgrex covering our catalog)
+    :param cache: a semgrexCache from semgrexCache.py (default: None), only the sentences missing from it are sent to Semgrex
+    :param stats: a filterStats from filterStats.py, collecting stage timings and match counts (default: None)
+    :param selector: a patternSelector, sending to Semgrex only the patterns whose preconditions hold in each sub-sentence
+        (default: None, all the patterns for all the sub-sentences)
     """
+
+    # optional lexical pre-filtering of the sub-sentences
+    kept = None
+    if prefilter is not None:
+        with _timer(stats, "prefilter"):
+            kept = prefilter.candidate_sentences(my_sample)
+        if not kept:
+            return []
+
+    # patterns strings, compiled once per catalog
+    catalog = compiledCatalog.of(patterns)
+    PATTERNS = catalog.strings(enhanced, LEXICAL_CONSTRAINTS if constrained else None)
+    check_engine(engine, PATTERNS)
     
     # CONLL-U to stanza.doc
-    doc = CoNLL.conll2doc(input_str=my_sample.get("conllu_str"))
-
-    # building patterns string catalog
-    PATTERNS = [p.enhanced if enhanced else p.basic for p in patterns]
+    if engine == "corenlp" and cache is None and selector is None:
+        with _timer(stats, "conll2doc"):
+            doc = CoNLL.conll2doc(input_str=my_sample.get("conllu_str") if kept is None else _semgrex_input(my_sample, kept))
 
     # search for all the patterns
     try:
-        results = semgrex.process_doc(doc, *PATTERNS, enhanced=enhanced)
+        with _timer(stats, "semgrex"):
+            if cache is not None or selector is not None:
+                if kept is None:
+                    kept = list(range(len(my_sample.conllu)))
+                sentences = [my_sample.conllu[i] for i in kept]
+                search = _sentence_search(PATTERNS, enhanced, backend, engine, selector, catalog)
+                if cache is not None:
+                    graph_results = cache.search(sentences, catalog=cache.catalog_key(PATTERNS, enhanced, engine, selector is not None), search=search)
+                else:
+                    graph_results = search(sentences)
+            elif engine == "python":
+                sentences = my_sample.conllu if kept is None else [my_sample.conllu[i] for i in kept]
+                graph_results = pySemgrex.process_sentences(sentences, *PATTERNS, enhanced=enhanced).result
+            else:
+                graph_results = run_semgrex(doc, PATTERNS, enhanced, backend).result
     except Exception as e:
         raise RuntimeError(f"Semgrex failed on sample ID={my_sample.get('id')} with error: {e}")
     
 
-    # convert the results to a dict
-    semgrex_dict = MessageToDict(results)
+    # results of each sub-sentence
+    if kept is not None:
+        graph_results = _expand_results(graph_results, kept, len(my_sample.conllu))
 
     # convert to a 'match' format
-    patterns = to_pattern(my_sample, semgrexMatches=semgrex_dict)
+    with _timer(stats, "to_pattern"):
+        patterns = to_pattern(my_sample, semgrexMatches=graph_results, compact=compact, catalog=catalog)
 
     # discard patterns with no lexical items potentially spatial (ie. in spatial_lexicon.keys())
-    raw_patterns = [
-        p for p in patterns if has_spatial_lexeme(p, LNs, PREPs)
-    ]
+    with _timer(stats, "has_spatial_lexeme"):
+        raw_patterns = [
+            p for p in patterns if has_spatial_lexeme(p, LNs, PREPs)
+        ]
+    if stats is not None:
+        stats.count("candidates", patterns)
+        stats.count("lexical", raw_patterns)
 
     return raw_patterns
-    
+
+def filter_batch(
+    samples:list[sample],
+    patterns:list[semgrexPattern] | compiledCatalog = ALL_PATTERNS,
+    enhanced:bool = False,
+    batch_size:int = 256,
+    backend = None,
+    prefilter:lexicalPrefilter = None,
+    compact:bool = False,
+    constrained:bool = False,
+    engine:str = "corenlp",
+    cache = None,
+    stats = None,
+    selector:patternSelector = None,
+) -> list[list[pattern]]:
+    """
+    performs the lexico-syntactic filtering of many samples, with a single Semgrex call per batch
+    returns, for each sample (in input order), the same list of pattern instances as `filter()`
+
+    The samples of a batch are concatenated into one stanza.doc, so that the java subprocess
+    launch, the serialization and the catalog compilation are paid once per batch and not once per sample.
+    Semgrex results are then sliced back to each sample according to its number of sub-sentences.
+
+    :param samples: an iterable of sample instances
+    :param patterns: a list of semgrexPattern instances to be used for filtering, or their compiledCatalog (default: ALL_PATTERNS from mySemgrexPatterns.py)
+    :param enhanced: whether to search for enhancedDependencies or not (default: False)
+    :param batch_size: maximum number of samples sent to Semgrex at once
+    :param backend: a persistent Semgrex backend from semgrexBackend.py (default: None, a java process is launched for each batch)
+    :param prefilter: a lexicalPrefilter instance, skipping sub-sentences with no spatial term (default: None, no pre-filtering)
+    :param compact: whether to return compactPattern instances instead of pattern instances (default: False)
+    :param constrained: whether to compile the spatial lexicon (st0) and the "be" forms (verb) into the Semgrex patterns,
+        so that Semgrex discards the candidates removed afterwards by `has_spatial_lexeme()` and `resolve()` (default: False)
+    :param engine: "corenlp" (Semgrex in java, default) or "python" (pySemgrex.py, no JVM, subset of Semgrex covering our catalog)
+    :param cache: a semgrexCache from semgrexCache.py (default: None), only the sentences missing from it are sent to Semgrex,
+        each distinct sentence of the batch once
+    :param stats: a filterStats from filterStats.py, collecting stage timings and match counts (default: None)
+    :param selector: a patternSelector, sending to Semgrex only the patterns whose preconditions hold in each sub-sentence
+        (default: None, all the patterns for all the sub-sentences, in a single call per batch)
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+
+    # patterns strings, compiled once per catalog
+    catalog = compiledCatalog.of(patterns)
+    PATTERNS = catalog.strings(enhanced, LEXICAL_CONSTRAINTS if constrained else None)
+    check_engine(engine, PATTERNS)
+    if cache is not None or selector is not None:
+        search = _sentence_search(PATTERNS, enhanced, backend, engine, selector, catalog)
+    if cache is not None:
+        cache_key = cache.catalog_key(PATTERNS, enhanced, engine, selector is not None)
+
+    all_patterns = []
+    samples = iter(samples)
+    while batch := list(islice(samples, batch_size)):
+
+        # optional lexical pre-filtering of the sub-sentences
+        with _timer(stats, "prefilter"):
+            kept = [
+                prefilter.candidate_sentences(s) if prefilter is not None else list(range(len(s.conllu)))
+                for s in batch
+            ]
+        n_sents = [len(k) for k in kept]
+        if not sum(n_sents):
+            all_patterns.extend([] for _ in batch)
+            continue
+
+        # CONLL-U to stanza.doc : one doc for the whole batch
+        if engine == "corenlp" and cache is None and selector is None:
+            with _timer(stats, "conll2doc"):
+                doc = CoNLL.conll2doc(input_str="\n\n".join(
+                    _semgrex_input(s, k) for s, k in zip(batch, kept) if k
+                ))
+            if len(doc.sentences) != sum(n_sents):
+                raise RuntimeError(
+                    f"Batch of samples IDs={[s.get('id') for s in batch]} was converted into "
+                    f"{len(doc.sentences)} sentences instead of {sum(n_sents)}"
+                )
+
+        # search for all the patterns, in all the sentences of the batch
+        try:
+            with _timer(stats, "semgrex"):
+                if cache is not None:
+                    sentences = [s.conllu[i] for s, k in zip(batch, kept) for i in k]
+                    graph_results = cache.search(sentences, catalog=cache_key, search=search)
+                elif selector is not None:
+                    graph_results = search([s.conllu[i] for s, k in zip(batch, kept) for i in k])
+                elif engine == "python":
+                    sentences = [s.conllu[i] for s, k in zip(batch, kept) for i in k]
+                    graph_results = pySemgrex.process_sentences(sentences, *PATTERNS, enhanced=enhanced).result
+                else:
+                    graph_results = run_semgrex(doc, PATTERNS, enhanced, backend).result
+        except Exception as e:
+            raise RuntimeError(f"Semgrex failed on batch of samples IDs={[s.get('id') for s in batch]} with error: {e}")
+
+        # mapping back the sentences results to each sample, with sub-sentences offsets
+        offset = 0
+        found = []
+        with _timer(stats, "to_pattern"):
+            for my_sample, k, n in zip(batch, kept, n_sents):
+                sample_matches = _expand_results(graph_results[offset:offset + n], k, len(my_sample.conllu))
+                offset += n
+                found.append(to_pattern(my_sample, semgrexMatches=sample_matches, compact=compact, catalog=catalog))
+
+        # discard patterns with no lexical items potentially spatial
+        with _timer(stats, "has_spatial_lexeme"):
+            lexical = [[p for p in f if has_spatial_lexeme(p, LNs, PREPs)] for f in found]
+        all_patterns.extend(lexical)
+        if stats is not None:
+            for f, l in zip(found, lexical):
+                stats.count("candidates", f)
+                stats.count("lexical", l)
+
+    return all_patterns
+
+#%% basic and enhanced dependencies in a single pass
+GRAPHS = ("basic", "enhanced", "both")
+
+def build_dual_request(doc, BASIC:list[str], ENHANCED:list[str]) -> tuple:
+    """
+    a single SemgrexRequest searching the basic patterns in the basic graph of each sentence,
+    and the enhanced patterns in its enhanced graph
+    returns the request, and the index of each basic / enhanced pattern in its semgrex list (identical strings are sent once)
+
+    The first len(doc.sentences) queries are the basic graphs, the next ones the enhanced graphs.
+    """
+    request = semgrex.SemgrexRequest()
+    unique = list(dict.fromkeys([*BASIC, *ENHANCED]))
+    request.semgrex.extend(unique)
+    position = {p: i for i, p in enumerate(unique)}
+
+    for sent_idx, sentence in enumerate(doc.sentences):
+        query = request.query.add()
+        word_idx = 0
+        for token in sentence.tokens:
+            for word in token.words:
+                semgrex.add_token(query.token, word, token)
+                semgrex.add_word_to_graph(query.graph, word, sent_idx, word_idx)
+                word_idx += 1
+    for sent_idx, sentence in enumerate(doc.sentences):
+        semgrex.convert_networkx_graph(request.query.add().graph, sentence, sent_idx)
+
+    return request, [position[p] for p in BASIC], [position[p] for p in ENHANCED]
+
+def _select_patterns(graph_result, indexes:list[int]):
+    """GraphResult restricted to the patterns at `indexes`, renumbered in catalog order"""
+    selected = SemgrexResponse.GraphResult()
+    for semgrex_index, i in enumerate(indexes):
+        semgrex_result = selected.result.add()
+        semgrex_result.CopyFrom(graph_result.result[i])
+        for match in semgrex_result.match:
+            match.semgrexIndex = semgrex_index
+    return selected
+
+def run_semgrex_dual(doc, BASIC:list[str], ENHANCED:list[str], backend = None) -> tuple[list, list]:
+    """
+    searches the basic and the enhanced patterns of a stanza.doc with one Semgrex call
+    returns the GraphResults of the basic graphs and of the enhanced graphs (one per sentence each)
+    """
+    request, basic_indexes, enhanced_indexes = build_dual_request(doc, BASIC, ENHANCED)
+    if backend is None:
+        response = semgrex.send_semgrex_request(request)
+    else:
+        response = backend.process_request(request)
+    n = len(doc.sentences)
+    if len(response.result) != 2 * n:
+        raise RuntimeError(f"Semgrex returned {len(response.result)} graph results for {2 * n} queries")
+    return (
+        [_select_patterns(r, basic_indexes) for r in response.result[:n]],
+        [_select_patterns(r, enhanced_indexes) for r in response.result[n:]],
+    )
+
+def merge_graphs(basic:list[pattern], enhanced:list[pattern]) -> list[pattern]:
+    """
+    tags each pattern with the graph it was found in ('graph' : "basic", "enhanced" or "both")
+    a match found in both graphs (same `hash`) is kept once, as found in the basic graph ;
+    the matches of each graph are otherwise kept as `filter()` returns them
+    """
+    in_basic = {}
+    for p in basic:
+        p["graph"] = "basic"
+        in_basic.setdefault(p["hash"], []).append(p)
+    merged = list(basic)
+    for p in enhanced:
+        if p["hash"] in in_basic:
+            for q in in_basic[p["hash"]]:
+                q["graph"] = "both"
+        else:
+            p["graph"] = "enhanced"
+            merged.append(p)
+    return merged
+
+def filter_dual_batch(
+    samples:list[sample],
+    patterns:list[semgrexPattern] | compiledCatalog = ALL_PATTERNS,
+    batch_size:int = 256,
+    backend = None,
+    prefilter:lexicalPrefilter = None,
+    constrained:bool = False,
+    engine:str = "corenlp",
+    stats = None,
+) -> list[list[pattern]]:
+    """
+    same as `filter_batch()`, searching both the basic and the enhanced dependencies in a single pass :
+    each batch is converted once, and both variants of every pattern are sent in the same Semgrex request.
+    Each pattern is tagged with the graph it was found in ('graph' : "basic", "enhanced" or "both"),
+    matches found in both graphs (same `hash`) being merged.
+
+    :param samples: an iterable of sample instances
+    :param patterns: a list of semgrexPattern instances to be used for filtering, or their compiledCatalog (default: ALL_PATTERNS from mySemgrexPatterns.py)
+    :param batch_size: maximum number of samples sent to Semgrex at once
+    :param backend: a persistent Semgrex backend from semgrexBackend.py (default: None, a java process is launched for each batch)
+    :param prefilter: a lexicalPrefilter instance, skipping sub-sentences with no spatial term (default: None, no pre-filtering)
+    :param constrained: whether to compile the spatial lexicon (st0) and the "be" forms (verb) into the Semgrex patterns (default: False)
+    :param engine: "corenlp" (Semgrex in java, default) or "python" (pySemgrex.py, no JVM)
+    :param stats: a filterStats from filterStats.py, collecting stage timings and match counts (default: None)
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+
+    # both variants of the patterns strings, compiled once per catalog
+    catalog = compiledCatalog.of(patterns)
+    constraints = LEXICAL_CONSTRAINTS if constrained else None
+    BASIC, ENHANCED = catalog.strings(False, constraints), catalog.strings(True, constraints)
+    check_engine(engine, BASIC + ENHANCED)
+
+    all_patterns = []
+    samples = iter(samples)
+    while batch := list(islice(samples, batch_size)):
+
+        # optional lexical pre-filtering of the sub-sentences
+        with _timer(stats, "prefilter"):
+            kept = [
+                prefilter.candidate_sentences(s) if prefilter is not None else list(range(len(s.conllu)))
+                for s in batch
+            ]
+        n_sents = [len(k) for k in kept]
+        if not sum(n_sents):
+            all_patterns.extend([] for _ in batch)
+            continue
+
+        # CONLL-U to stanza.doc : one doc for the whole batch, for both graphs
+        if engine == "corenlp":
+            with _timer(stats, "conll2doc"):
+                doc = CoNLL.conll2doc(input_str="\n\n".join(
+                    _semgrex_input(s, k) for s, k in zip(batch, kept) if k
+                ))
+            if len(doc.sentences) != sum(n_sents):
+                raise RuntimeError(
+                    f"Batch of samples IDs={[s.get('id') for s in batch]} was converted into "
+                    f"{len(doc.sentences)} sentences instead of {sum(n_sents)}"
+                )
+
+        # search for both variants of all the patterns, in all the sentences of the batch
+        try:
+            with _timer(stats, "semgrex"):
+                if engine == "python":
+                    sentences = [s.conllu[i] for s, k in zip(batch, kept) for i in k]
+                    basic_results = pySemgrex.process_sentences(sentences, *BASIC).result
+                    enhanced_results = pySemgrex.process_sentences(sentences, *ENHANCED, enhanced=True).result
+                else:
+                    basic_results, enhanced_results = run_semgrex_dual(doc, BASIC, ENHANCED, backend)
+        except Exception as e:
+            raise RuntimeError(f"Semgrex failed on batch of samples IDs={[s.get('id') for s in batch]} with error: {e}")
+
+        offset = 0
+        for my_sample, k, n in zip(batch, kept, n_sents):
+            with _timer(stats, "to_pattern"):
+                found = [
+                    to_pattern(my_sample, semgrexMatches=_expand_results(results[offset:offset + n], k, len(my_sample.conllu)), catalog=catalog)
+                    for results in (basic_results, enhanced_results)
+                ]
+            offset += n
+            with _timer(stats, "has_spatial_lexeme"):
+                lexical = [[p for p in f if has_spatial_lexeme(p, LNs, PREPs)] for f in found]
+            if stats is not None:
+                # as merged, repeats included : the same count as `lexical` before the lexical filter
+                stats.count("candidates", merge_graphs(*found))
+            merged = merge_graphs(*lexical)
+            all_patterns.append(merged)
+            if stats is not None:
+                stats.count("lexical", merged)
+
+    return all_patterns
+
+def filter_dual(my_sample:sample, **kwargs) -> list[pattern]:
+    """`filter_dual_batch()` of a single sample, see its parameters"""
+    return filter_dual_batch([my_sample], **kwargs)[0]
+
 def resolve(
         raw_patterns:list[pattern], 
         verbose:bool = False,
         lang= 'en',
+        stats = None,
+        catalog:compiledCatalog = None,
 ) -> list[pattern]:
     """
     Resolves conflicts between `pattern`.
@@ -165,7 +790,16 @@ def resolve(
     
     :param raw_patterns: a list of pattern instances to be resolved
     :param lang: language specific mode (TODO)
+    :param stats: a filterStats from filterStats.py, collecting the time spent and the resolved matches (default: None)
+    :param catalog: the compiledCatalog the patterns come from, telling the complex preposition ones
+        (default: None, patterns whose name contains "complex")
     """
+    if stats is not None:
+        with stats.time("resolve"):
+            refined_set = resolve(raw_patterns, verbose=verbose, lang=lang, catalog=catalog)
+        stats.count("resolved", refined_set)
+        return refined_set
+
     if verbose:
         print('--- All matches')
         for match in raw_patterns:
@@ -188,30 +822,42 @@ def resolve(
         for match in refined_set:
             print('\033[34;1m', match.get("minimal_span"), '\033[0m') 
     
+    # Indexing the matches : nodes of each match and complex-pattern membership, computed once
+    # node indexes are only comparable within a sub-sentence : the rules compare matches of the same (sample, sub-sentence)
+    nodes = [match.get("nodes", {}) for match in refined_set]
+    sent_ids = [(match.get("id"), match.get("sub_sent_id")) for match in refined_set]
+    if catalog is not None:
+        is_complex = [catalog.is_complex(match.get("patternName")) for match in refined_set]
+    else:
+        is_complex = ["complex" in (match.get("patternName") or "") for match in refined_set]
+
     # removing simple preposition patterns embedded into complex prepositions 
-    refined_set = [
-        match for i, match in enumerate(refined_set)
-        if not any(
-            i != j
-            and match.get("sent_id") == other_match.get("sent_id")
-            and match.get("nodes", {}).get("ground") == other_match.get("nodes", {}).get("st0")
-            and match.get("nodes", {}).get("figure") == other_match.get("nodes", {}).get("figure")
-            and "complex" in other_match.get("patternName")
-            for j, other_match in enumerate(refined_set)
-        )
+    # i.e. the ground of the match is the st0 of a complex match sharing the same figure
+    complex_by_st0 = Counter(
+        (sent_id, n.get("figure"), n.get("st0"))
+        for sent_id, n, cplx in zip(sent_ids, nodes, is_complex) if cplx
+    )
+    kept = [
+        i for i, (sent_id, n, cplx) in enumerate(zip(sent_ids, nodes, is_complex))
+        # not counting the match itself (i != j)
+        if complex_by_st0[(sent_id, n.get("figure"), n.get("ground"))] - (cplx and n.get("st0") == n.get("ground")) == 0
     ]
+    refined_set = [refined_set[i] for i in kept]
+    nodes = [nodes[i] for i in kept]
+    sent_ids = [sent_ids[i] for i in kept]
+    is_complex = [is_complex[i] for i in kept]
 
     # removing patterns with simple prepositions embedded into complex prepositions and sharing figure and ground
+    complex_by_ground = Counter(
+        (sent_id, n.get("figure"), n.get("ground"))
+        for sent_id, n, cplx in zip(sent_ids, nodes, is_complex) if cplx
+    )
     refined_set = [
-        match for i, match in enumerate(refined_set)
-        if not any(
-            i != j
-            and match.get("sent_id") == other_match.get("sent_id")
-            and match.get("nodes", {}).get("ground") == other_match.get("nodes", {}).get("ground")
-            and match.get("nodes", {}).get("figure") == other_match.get("nodes", {}).get("figure")
-            and "complex" in other_match.get("patternName")
-            and "simple" in match.get("patternName", "")
-            for j, other_match in enumerate(refined_set)
+        match for match, sent_id, n, cplx in zip(refined_set, sent_ids, nodes, is_complex)
+        if not (
+            "simple" in match.get("patternName", "")
+            # not counting the match itself (i != j)
+            and complex_by_ground[(sent_id, n.get("figure"), n.get("ground"))] - cplx > 0
         )
     ]
     if verbose:
@@ -221,6 +867,24 @@ def resolve(
 
     return refined_set
 
+def resolve_many(
+        raw_patterns_per_sample:list[list[pattern]],
+        verbose:bool = False,
+        lang= 'en',
+        stats = None,
+        catalog:compiledCatalog = None,
+) -> list[list[pattern]]:
+    """
+    Resolves conflicts between `pattern` of many samples (e.g. the output of `filter_batch()`).
+    Each sample is resolved on its own, with the indexed `resolve()` : linear in the total number of matches.
+
+    :param raw_patterns_per_sample: for each sample, a list of pattern instances to be resolved
+    :param lang: language specific mode (TODO)
+    :param stats: a filterStats from filterStats.py (default: None)
+    :param catalog: the compiledCatalog the patterns come from, see `resolve()`
+    """
+    return [resolve(raw_patterns, verbose=verbose, lang=lang, stats=stats, catalog=catalog) for raw_patterns in raw_patterns_per_sample]
+
 
 #%% main
 if __name__ == "__main__":
@@ -231,17 +895,11 @@ if __name__ == "__main__":
     corenlp_dir = os.path.join(resources, "stanford-corenlp-4.5.8/")
     os.environ["CORENLP_HOME"] = corenlp_dir
 
-    with open("examples.conllu", "r", encoding="utf-8") as f:
-        parsed_corpus = [b for b in f.read().split("\n\n\n") if b.strip()]
-        
-    for sentences in parsed_corpus:
+    # streaming the corpus, sample by sample.
+    # The CONLL-U strings must contain metadata 'text' and 'sent_id'
+    # and are parsed by the `sample` class    
+    for my_sample in read_samples("examples.conllu"):
 
-        # instanciating a sample object.
-        # The CONLL-U string must contain metadata 'text' and 'sent_id'
-        # and is parsed by the `sample` class    
-        my_sample = sample(
-            conllu_str=sentences
-        )
         print('-'*30)
         print('\033[1m', my_sample['text'], '\033[0m')
         print('-'*30)
@@ -0,0 +1,61 @@
+######################################################################
+# Local stand-in for the Semgrex java process of semgrexBackend.py
+# (same length-prefixed protobuf protocol, no JVM) :
+# each pattern matches the root of each sentence, node "pattern" holds
+# the index of the pattern and node "pid" the id of this process
+#
+# usage : python fakeSemgrexServer.py [--delay seconds] [--die-at n]
+#  --delay : seconds spent on each request
+#  --die-at : exits, without answering, on its n-th request
+######################################################################
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lazyImports import import_standalone
+
+CoreNLP_pb2 = import_standalone("stanza.protobuf.CoreNLP_pb2")
+
+def serve(delay:float = 0., die_at:int = None):
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    n = 0
+    while True:
+        length = stdin.read(4)
+        if len(length) < 4:
+            return
+        length = int.from_bytes(length, "big")
+        if length == 0: # asked to exit
+            return
+        request = CoreNLP_pb2.SemgrexRequest()
+        request.ParseFromString(stdin.read(length))
+        n += 1
+        if n == die_at:
+            os._exit(1)
+        time.sleep(delay)
+
+        response = CoreNLP_pb2.SemgrexResponse()
+        for _ in request.query:
+            graph_result = response.result.add()
+            for i, _ in enumerate(request.semgrex):
+                match = graph_result.result.add().match.add()
+                match.matchIndex = 1
+                match.semgrexIndex = i
+                for name, index in (("pattern", i), ("pid", os.getpid())):
+                    node = match.node.add()
+                    node.name = name
+                    node.matchIndex = index
+        text = response.SerializeToString()
+        stdout.write(len(text).to_bytes(4, "big"))
+        stdout.write(text)
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.)
+    parser.add_argument("--die-at", type=int, default=None)
+    args = parser.parse_args()
+    serve(args.delay, args.die_at)
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import asyncFilter
+from asyncFilter import filter_async, filter_stream_async
+
+@pytest.fixture
+def slow_filter(monkeypatch):
+    """samples are (name, seconds) : "hang" blocks until the end of the test, the others sleep"""
+    release = threading.Event()
+    def fake(my_sample, resolved, filter_kwargs):
+        name, seconds = my_sample
+        if name == "hang":
+            release.wait()
+        else:
+            time.sleep(seconds)
+        return [name]
+    monkeypatch.setattr(asyncFilter, "_filter_sample", fake)
+    yield
+    release.set()
+
+def test_timeout_starts_with_the_call(slow_filter):
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # the second call waits 0.3 s for the thread, then runs 0.3 s : within its timeout
+            return await asyncio.gather(*(filter_async(("ok", 0.3), timeout=0.5, executor=executor) for _ in range(2)))
+    assert asyncio.run(main()) == [["ok"], ["ok"]]
+
+def test_hung_calls_do_not_stall_the_stream(slow_filter):
+    samples = [("hang", 0)] * 5 + [("ok", 0.01)] * 10
+    async def main():
+        return [found async for _, found in filter_stream_async(
+            samples, concurrency=2, timeout=0.1, return_exceptions=True, max_hung=2,
+        )]
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    assert time.perf_counter() - start < 2
+    assert all(isinstance(r, asyncio.TimeoutError) for r in results[:5])
+    assert results[5:] == [["ok"]] * 10
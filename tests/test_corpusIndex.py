@@ -0,0 +1,17 @@
+from corpusIndex import corpusIndex
+from corpusRunner import shard_key
+
+TOKEN = "1\tup\tup\tADV\tRB\t_\t0\troot\t_\t_"
+
+def test_sent_id_without_spaces(tmp_path):
+    headers = ["# sent_id = spaced", "#sent_id=tight", "#  sent_id= loose  ", "# text = no id"]
+    blocks = [f"{header}\n{TOKEN}" for header in headers]
+    path = tmp_path / "corpus.conllu"
+    path.write_text("\n\n\n".join(blocks) + "\n", encoding="utf-8")
+
+    with corpusIndex(str(path)) as index:
+        assert list(index.ids()) == ["spaced", "tight", "loose", None]
+        assert index.block("tight") == blocks[1]
+        assert index.sample("tight")["id"] == "tight"
+    # the same sent_id for the sharding of corpusRunner
+    assert [shard_key(b) for b in blocks[:3]] == ["spaced", "tight", "loose"]
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+import corpusRunner
+from corpusRunner import run_corpus, run_corpus_resumable
+
+class _Killed(Exception):
+    pass
+
+@pytest.fixture
+def corpus(tmp_path):
+    with open("examples.conllu", "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    path = tmp_path / "corpus.conllu"
+    # a malformed sample, for the dead-letter file
+    path.write_text(text + "\n\n\n# sent_id = broken\n1\tbroken\n\n\n" + text.replace("sent_id = ", "sent_id = copy-") + "\n", encoding="utf-8")
+    return str(path)
+
+def _lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_resume_after_two_kills(corpus, tmp_path, monkeypatch):
+    # no JVM : the workers search with the python engine
+    kwargs = dict(workers=1, chunk_size=3, engine="python")
+    reference = str(tmp_path / "reference.jsonl")
+    assert run_corpus_resumable(corpus, reference, **kwargs)["failed"] == 1
+
+    save_checkpoint = corpusRunner._save_checkpoint
+    def killed_at(n):
+        calls = []
+        def save(checkpoint, state):
+            calls.append(state)
+            if len(calls) == n:
+                # the chunk is written, its checkpoint is not
+                raise _Killed()
+            save_checkpoint(checkpoint, state)
+        return save
+
+    process_chunk = corpusRunner._process_chunk
+    def flaky(blocks):
+        # a transient failure of the 7th sample (3rd chunk), gone after the first kill
+        if any(corpusRunner._block_id(b) == flaky_id for b in blocks):
+            raise RuntimeError("Semgrex timed out")
+        return process_chunk(blocks)
+    flaky_id = _lines(reference)[6]["id"]
+
+    output = str(tmp_path / "output.jsonl")
+    for n, process in ((3, flaky), (2, process_chunk)):
+        monkeypatch.setattr(corpusRunner, "_process_chunk", process)
+        monkeypatch.setattr(corpusRunner, "_save_checkpoint", killed_at(n))
+        with pytest.raises(_Killed):
+            run_corpus_resumable(corpus, output, **kwargs)
+    monkeypatch.setattr(corpusRunner, "_save_checkpoint", save_checkpoint)
+    run = run_corpus_resumable(corpus, output, **kwargs)
+
+    assert run["resumed_from"] == 3 * (2 + 1)
+    assert _lines(output) == _lines(reference)
+    assert _lines(output + ".failed") == _lines(reference + ".failed")
+    with open(output + ".checkpoint", "r", encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["output_bytes"] == os.path.getsize(output)
+    assert state["dead_letter_bytes"] == os.path.getsize(output + ".failed")
+
+def test_engine_reaches_the_worker_processes():
+    # no monkeypatch : it would not reach processes started without fork
+    serial = [(i, [p["hash"] for p in found]) for i, found in run_corpus("examples.conllu", workers=1, chunk_size=3, engine="python")]
+    pooled = [(i, [p["hash"] for p in found]) for i, found in run_corpus("examples.conllu", workers=2, chunk_size=3, engine="python")]
+    assert pooled == serial
+    assert any(hashes for _, hashes in serial)
+
+def test_unknown_engine_fails_before_the_run(corpus, tmp_path):
+    with pytest.raises(ValueError):
+        run_corpus_resumable(corpus, str(tmp_path / "output.jsonl"), workers=1, engine="java")
+    assert not os.path.exists(tmp_path / "output.jsonl")
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from corpusRunner import run_corpus_resumable
+from corpusShards import merge_shards, run_shard
+
+N_SHARDS = 3
+
+@pytest.fixture
+def corpus(tmp_path):
+    with open("examples.conllu", "r", encoding="utf-8") as f:
+        blocks = f.read().strip().split("\n\n\n")
+    path = tmp_path / "corpus.conllu"
+    # the same sentence twice in the corpus : two samples with the same sent_id, and the same match hashes
+    path.write_text("\n\n\n".join(blocks + blocks[:2]) + "\n", encoding="utf-8")
+    return str(path)
+
+def _records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return sorted((json.loads(line) for line in f), key=lambda r: (r["id"], json.dumps(r)))
+
+def _run_shards(corpus, tmp_path):
+    manifests = []
+    for k in range(N_SHARDS):
+        output = str(tmp_path / f"shard-{k}.jsonl")
+        run_shard(corpus, output, k, N_SHARDS, workers=1, engine="python")
+        manifests.append(output + ".manifest.json")
+    return manifests
+
+@pytest.mark.parametrize("with_corpus", [False, True])
+def test_samples_sharing_a_sent_id(corpus, tmp_path, with_corpus):
+    reference = str(tmp_path / "reference.jsonl")
+    run_corpus_resumable(corpus, reference, workers=1, engine="python")
+    manifests = _run_shards(corpus, tmp_path)
+
+    merged = str(tmp_path / "merged.jsonl")
+    report = merge_shards(manifests, merged, corpus=corpus if with_corpus else None)
+    assert report["errors"] == [] and report["duplicate_samples"] == 0
+    assert _records(merged) == _records(reference)
+
+def test_shard_given_twice(corpus, tmp_path):
+    manifests = _run_shards(corpus, tmp_path)
+    with pytest.raises(ValueError, match="more than once"):
+        merge_shards(manifests + manifests[:1], str(tmp_path / "merged.jsonl"))
+    report = merge_shards(manifests + manifests[:1], str(tmp_path / "merged.jsonl"), corpus=corpus, strict=False)
+    assert report["duplicate_samples"] > 0
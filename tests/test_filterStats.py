@@ -0,0 +1,35 @@
+import socket
+
+from filterStats import filterStats
+from myCorpusObjects import read_samples
+from syntacticFilter import filter_batch
+
+def _received(sock) -> dict:
+    totals = {}
+    sock.settimeout(0.2)
+    try:
+        while True:
+            name, value = sock.recv(65536).decode("utf-8").split("|")[0].rsplit(":", 1)
+            totals[name] = totals.get(name, 0) + float(value)
+    except socket.timeout:
+        return totals
+
+def test_statsd_sends_increments():
+    stats = filterStats()
+    samples = list(read_samples("examples.conllu"))
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+        server.bind(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        filter_batch(samples, engine="python", stats=stats)
+        stats.send_statsd("127.0.0.1", port)
+        # nothing new : nothing sent
+        assert stats.to_statsd() == []
+        filter_batch(samples, engine="python", stats=stats)
+        stats.send_statsd("127.0.0.1", port)
+        totals = _received(server)
+
+    # what the server summed up is the totals of the stats, not more
+    for (step, name), n in stats.matches.items():
+        assert totals[f"spatial_filter.pattern.{name}.{step}"] == n
+    for stage, calls in stats.calls.items():
+        assert totals[f"spatial_filter.stage.{stage}.calls"] == calls
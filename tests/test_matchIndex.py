@@ -0,0 +1,44 @@
+from matchIndex import matchIndex
+from myCorpusObjects import read_samples
+from syntacticFilter import filter_batch, resolve_many
+
+def _matches():
+    found = resolve_many(filter_batch(list(read_samples("examples.conllu")), engine="python"))
+    return [p for patterns in found for p in patterns]
+
+def test_postings_survive_several_flushes(tmp_path):
+    matches = _matches()
+    half = len(matches) // 2
+    with matchIndex(str(tmp_path / "matches.index.sqlite"), flush_every=3) as index:
+        index.add(matches[:half])
+        first = {name: len(index.query(pattern=name)) for name in {p["patternName"] for p in matches}}
+        # terms already in `postings` get new ids
+        index.add(matches[half:])
+        for name in first:
+            expected = sorted(p["hash"] for p in matches if p["patternName"] == name)
+            assert sorted(m["hash"] for m in index.search(pattern=name)) == expected
+            assert index.values("pattern")[name] == len(expected)
+            assert list(index.postings("pattern", name)) == sorted(index.postings("pattern", name))
+
+    # and once reopened
+    with matchIndex(str(tmp_path / "matches.index.sqlite")) as index:
+        assert len(index) == len({p["hash"] for p in matches})
+        assert sum(index.values("pattern").values()) == len(index)
+
+def test_flushes_write_segments_merged_by_compact(tmp_path):
+    matches = _matches()
+    with matchIndex(str(tmp_path / "matches.index.sqlite"), flush_every=2) as index:
+        index.add(matches)
+        index.flush()
+        segments = lambda: index._db.execute("SELECT COUNT(*), COUNT(DISTINCT term) FROM postings").fetchone()
+        n_segments, n_terms = segments()
+        # one row per term and flush : former segments are not rewritten
+        assert n_segments > n_terms
+        before = {term: list(index.postings(*term.split("\t"))) for term, in index._db.execute("SELECT DISTINCT term FROM postings").fetchall()}
+        values = index.values("st0_lemma")
+
+        assert index.compact() > 0
+        assert segments() == (n_terms, n_terms)
+        assert {term: list(index.postings(*term.split("\t"))) for term in before} == before
+        assert index.values("st0_lemma") == values
+        assert index.compact() == 0
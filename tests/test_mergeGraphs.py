@@ -0,0 +1,37 @@
+import copy
+
+from myCorpusObjects import read_samples
+from syntacticFilter import filter_batch, merge_graphs
+
+def _matches():
+    return [p for found in filter_batch(list(read_samples("examples.conllu")), engine="python") for p in found]
+
+def test_deduplicates_across_graphs_only():
+    matches = _matches()
+    assert len(matches) >= 3
+    # a repeated match in the basic graph stays repeated, as filter() returns it
+    basic = [matches[0], copy.copy(matches[0]), matches[1]]
+    enhanced = [copy.copy(matches[1]), matches[2], copy.copy(matches[2])]
+    merged = merge_graphs(basic, enhanced)
+    assert [p["hash"] for p in merged] == [p["hash"] for p in basic] + [matches[2]["hash"]] * 2
+    assert [p["graph"] for p in merged] == ["basic", "basic", "both", "enhanced", "enhanced"]
+
+def test_dual_batch_counts_repeated_candidates(monkeypatch):
+    import syntacticFilter
+    from filterStats import filterStats
+    samples = list(read_samples("examples.conllu"))
+    single = filterStats()
+    filter_batch(samples, engine="python", stats=single)
+
+    to_pattern = syntacticFilter.to_pattern
+    def repeated(*args, **kwargs):
+        # each match found twice in its graph
+        found = to_pattern(*args, **kwargs)
+        return found + [copy.copy(p) for p in found]
+    monkeypatch.setattr(syntacticFilter, "to_pattern", repeated)
+    stats = filterStats()
+    syntacticFilter.filter_dual_batch(samples, engine="python", stats=stats)
+
+    # examples.conllu has no enhanced graph : the candidates are those of the basic graph, twice
+    expected = {name: {step: 2 * c[step] for step in ("candidates", "lexical")} for name, c in single.report()["patterns"].items()}
+    assert {name: {step: c[step] for step in ("candidates", "lexical")} for name, c in stats.report()["patterns"].items()} == expected
@@ -0,0 +1,58 @@
+from myCorpusObjects import read_samples, sample
+from semgrexCache import semgrexCache
+from syntacticFilter import filter, filter_batch, patternSelector, resolve, resolve_many
+
+# Localization Nouns and prepositions as st0 of the complex patterns
+SENTENCES = """# sent_id = outside-of
+# text = The cat is on the outside of the house.
+1	The	the	DET	DT	_	2	det	_	_
+2	cat	cat	NOUN	NN	_	6	nsubj	_	_
+3	is	be	AUX	VBZ	_	6	cop	_	_
+4	on	on	ADP	IN	_	6	case	_	_
+5	the	the	DET	DT	_	6	det	_	_
+6	outside	outside	NOUN	NN	_	0	root	_	_
+7	of	of	ADP	IN	_	9	case	_	_
+8	the	the	DET	DT	_	9	det	_	_
+9	house	house	NOUN	NN	_	6	nmod	_	_
+10	.	.	PUNCT	.	_	6	punct	_	_
+
+
+# sent_id = right-of
+# text = The paytable will be to the right of the screen.
+1	The	the	DET	DT	_	2	det	_	_
+2	paytable	paytable	NOUN	NN	_	7	nsubj	_	_
+3	will	will	AUX	MD	_	7	aux	_	_
+4	be	be	AUX	VB	_	7	cop	_	_
+5	to	to	ADP	IN	_	7	case	_	_
+6	the	the	DET	DT	_	7	det	_	_
+7	right	right	NOUN	NN	_	0	root	_	_
+8	of	of	ADP	IN	_	10	case	_	_
+9	the	the	DET	DT	_	10	det	_	_
+10	screen	screen	NOUN	NN	_	7	nmod	_	_
+11	.	.	PUNCT	.	_	7	punct	_	_
+"""
+
+def _samples():
+    samples = list(read_samples("examples.conllu"))
+    samples += [sample(block) for block in SENTENCES.strip().split("\n\n\n")]
+    return samples
+
+def _hashes(found):
+    return [sorted(p["hash"] for p in patterns) for patterns in found]
+
+def test_selector_keeps_the_results():
+    samples = _samples()
+    plain = resolve_many(filter_batch(samples, engine="python"))
+    selected = resolve_many(filter_batch(samples, engine="python", selector=patternSelector()))
+    assert _hashes(selected) == _hashes(plain)
+    assert _hashes([resolve(filter(s, engine="python", selector=patternSelector())) for s in samples]) == _hashes(plain)
+    assert any(p["patternName"] == "blc-en-complex-iln-det" and p["st0"] == "outside" for p in plain[-2])
+
+def test_selector_results_cached_apart(tmp_path):
+    assert semgrexCache.catalog_key(["a"], selector=True) != semgrexCache.catalog_key(["a"])
+    samples = _samples()
+    with semgrexCache(str(tmp_path / "cache.sqlite")) as cache:
+        selected = filter_batch(samples, engine="python", selector=patternSelector(), cache=cache)
+        plain = filter_batch(samples, engine="python", cache=cache)
+    assert _hashes(plain) == _hashes(filter_batch(samples, engine="python"))
+    assert _hashes(selected) == _hashes(plain)
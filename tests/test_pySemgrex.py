@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+
+import conllu
+import pytest
+
+from mySemgrexPatterns import ALL_PATTERNS
+from pySemgrex import compile_pattern, process_sentences
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "golden", "pySemgrex_examples.json")
+
+def _matches() -> list:
+    """(semgrexIndex, named nodes) of every match of the catalog, per sentence of examples.conllu
+    (basic dependencies only : examples.conllu has no enhanced ones)"""
+    with open("examples.conllu", "r", encoding="utf-8") as f:
+        sentences = conllu.parse(f.read())
+    response = process_sentences(sentences, *[p.basic for p in ALL_PATTERNS])
+    golden, sent_id, sub_sent_id = [], None, 0
+    for sentence, graph_result in zip(sentences, response.result):
+        # only the first sentence of a sample carries its sent_id
+        if "sent_id" in sentence.metadata:
+            sent_id, sub_sent_id = sentence.metadata["sent_id"], 0
+        else:
+            sub_sent_id += 1
+        golden.append({
+            "sent_id": sent_id,
+            "sub_sent_id": sub_sent_id,
+            "matches": [
+                [match.semgrexIndex, {node.name: node.matchIndex for node in match.node}]
+                for semgrex_result in graph_result.result
+                for match in semgrex_result.match
+            ],
+        })
+    return golden
+
+def test_examples_match_golden_file():
+    with open(GOLDEN, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    assert _matches() == golden
+
+@pytest.mark.parametrize("pattern_str", [
+    "{}=a >> {}=b", # dominance
+    "{}=a < {}=b", # governor
+    "{}=a </nmod.*/ {}=b", # regex relation to the governor
+    "{}=a >>/nmod.*/ {}=b", # regex relation of a dominance
+    "{}=a !> {}=b", # negated relation
+    "{}=a >nmod {}=b !>case {}", # negated relation after a node
+    "{}=a >@ {}=b", # relation with a @
+    "{}=a @ {}=b", # alignment
+    "{}=a >nmod=rel {}=b", # named relation
+])
+def test_unsupported_syntax_raises(pattern_str):
+    with pytest.raises(ValueError):
+        compile_pattern(pattern_str)
+
+if __name__ == "__main__":
+    # regenerates the golden file (PYTHONPATH=. python tests/test_pySemgrex.py), to be reviewed before committing it
+    with open(GOLDEN, "w", encoding="utf-8") as f:
+        json.dump(_matches(), f, indent=1)
+
+def test_python_engine_does_not_import_stanza():
+    # a fresh interpreter, as other tests may have imported stanza already
+    script = (
+        "import sys\n"
+        "from myCorpusObjects import sample\n"
+        "from syntacticFilter import filter, resolve\n"
+        "with open('examples.conllu', encoding='utf-8') as f:\n"
+        "    assert resolve(filter(sample(f.read().split('\\n\\n\\n')[0]), engine='python'))\n"
+        "print('stanza' in sys.modules, 'torch' in sys.modules)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "False False"
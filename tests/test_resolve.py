@@ -0,0 +1,33 @@
+from myCorpusObjects import sample
+from syntacticFilter import filter, resolve
+
+OUTSIDE = """1	The	the	DET	DT	_	2	det	_	_
+2	cat	cat	NOUN	NN	_	6	nsubj	_	_
+3	is	be	AUX	VBZ	_	6	cop	_	_
+4	on	on	ADP	IN	_	6	case	_	_
+5	the	the	DET	DT	_	6	det	_	_
+6	outside	outside	NOUN	NN	_	0	root	_	_
+7	of	of	ADP	IN	_	9	case	_	_
+8	the	the	DET	DT	_	9	det	_	_
+9	house	house	NOUN	NN	_	6	nmod	_	_
+10	.	.	PUNCT	.	_	6	punct	_	_"""
+
+# figure (2) and ground (6) of its simple match are the figure and the st0 of the complex match above
+ROOF = """1	The	the	DET	DT	_	2	det	_	_
+2	dog	dog	NOUN	NN	_	6	nsubj	_	_
+3	is	be	AUX	VBZ	_	6	cop	_	_
+4	on	on	ADP	IN	_	6	case	_	_
+5	the	the	DET	DT	_	6	det	_	_
+6	roof	roof	NOUN	NN	_	0	root	_	_
+7	.	.	PUNCT	.	_	6	punct	_	_"""
+
+def _resolved(*sentences):
+    my_sample = sample("# sent_id = two-sentences\n" + "\n\n".join(sentences) + "\n")
+    return resolve(filter(my_sample, engine="python"))
+
+def test_sub_sentences_do_not_suppress_each_other():
+    alone = [(p["sub_sent_id"], p["patternName"], p["footprint"]) for p in _resolved(OUTSIDE)]
+    roof = [(p["sub_sent_id"] + 1, p["patternName"], p["footprint"]) for p in _resolved(ROOF)]
+    assert alone and roof
+    together = [(p["sub_sent_id"], p["patternName"], p["footprint"]) for p in _resolved(OUTSIDE, ROOF)]
+    assert sorted(together) == sorted(alone + roof)
@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+import time
+
+from stanza.server.semgrex import build_request
+from stanza.utils.conll import CoNLL
+
+from semgrexBackend import semgrexPool, semgrexWorker
+
+SERVER = os.path.join(os.path.dirname(__file__), "fakeSemgrexServer.py")
+
+def _command(*args) -> list[str]:
+    return [sys.executable, SERVER, *args]
+
+SENTENCE = """1	It	it	PRON	PRP	_	4	nsubj	_	_
+2	is	be	AUX	VBZ	_	4	cop	_	_
+3	on	on	ADP	IN	_	4	case	_	_
+4	top	top	NOUN	NN	_	0	root	_	_
+"""
+
+def _request(n_sentences:int, *patterns:str):
+    doc = CoNLL.conll2doc(input_str="\n".join([SENTENCE] * n_sentences))
+    return build_request(doc, patterns)
+
+def _nodes(match) -> dict:
+    return {node.name: node.matchIndex for node in match.node}
+
+def test_worker_round_trip():
+    with semgrexWorker(command=_command()) as worker:
+        for n_sentences in (2, 1, 3): # several requests on the same process
+            response = worker.process_request(_request(n_sentences, "{}=a", "{}=b >obl {}=c"))
+            assert len(response.result) == n_sentences
+            for graph_result in response.result:
+                assert [[_nodes(m)["pattern"] for m in r.match] for r in graph_result.result] == [[0], [1]]
+        pid = worker.pipe.pid
+        assert worker.is_alive() and worker.restarts == 0
+    assert worker.pipe is None
+    assert _nodes(response.result[0].result[0].match[0])["pid"] == pid
+
+def test_pool_serves_concurrent_requests_on_all_workers():
+    size, delay = 3, 0.5
+    with semgrexPool(size=size, command=_command("--delay", str(delay))) as pool:
+        pool.process_request(_request(1, "{}")) # launches a first worker
+        pids, errors = [], []
+        def call():
+            try:
+                response = pool.process_request(_request(1, "{}"))
+                pids.append(_nodes(response.result[0].result[0].match[0])["pid"])
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for _ in range(size)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        assert not errors
+        # each request has its own process : they run side by side, not one after the other
+        assert len(set(pids)) == size
+        assert elapsed < 2 * delay
+        assert all(state["alive"] for state in pool.health().values())
+
+def test_pool_restarts_a_dead_worker_and_retries():
+    # each process dies, without answering, on its second request
+    with semgrexPool(size=1, max_retries=1, command=_command("--die-at", "2")) as pool:
+        first = pool.process_request(_request(1, "{}"))
+        assert pool.health() == {0: {"alive": True, "restarts": 0}}
+
+        second = pool.process_request(_request(1, "{}")) # EOF, then retried on a new process
+        assert pool.health() == {0: {"alive": True, "restarts": 1}}
+        pid = lambda response: _nodes(response.result[0].result[0].match[0])["pid"]
+        assert pid(second) != pid(first)
+
+def test_pool_gives_up_after_max_retries():
+    # each process dies on its first request
+    with semgrexPool(size=1, max_retries=1, command=_command("--die-at", "1")) as pool:
+        try:
+            pool.process_request(_request(1, "{}"))
+        except BrokenPipeError:
+            pass
+        else:
+            raise AssertionError("expected a BrokenPipeError")
+        assert pool.health() == {0: {"alive": False, "restarts": 2}}
+
+def test_health_before_and_after_requests():
+    with semgrexPool(size=2, command=_command()) as pool:
+        # the processes are launched lazily
+        assert pool.health() == {i: {"alive": False, "restarts": 0} for i in range(2)}
+        pool.process_request(_request(1, "{}"))
+        assert sorted(state["alive"] for state in pool.health().values()) == [False, True]
+    assert pool.health() == {i: {"alive": False, "restarts": 0} for i in range(2)}